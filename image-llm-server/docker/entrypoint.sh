@@ -13,6 +13,7 @@ HF_HUB_CACHE="${HF_HUB_CACHE:-/home/vllm/.cache/huggingface}"
 HOST="${HOST:-0.0.0.0}"
 PORT="${PORT:-8000}"
 MAX_MODEL_LEN="${MAX_MODEL_LEN:-}"
+MAX_NUM_SEQS="${MAX_NUM_SEQS:-}"
 GPU_MEMORY_UTILIZATION="${GPU_MEMORY_UTILIZATION:-0.94}"
 TENSOR_PARALLEL_SIZE="${TENSOR_PARALLEL_SIZE:-1}"
 VLLM_ARGS="${VLLM_ARGS:-}"
@@ -136,4 +137,5 @@ exec python3 -m vllm.entrypoints.openai.api_server \
     --gpu-memory-utilization "${GPU_MEMORY_UTILIZATION}" \
     --tensor-parallel-size "${TENSOR_PARALLEL_SIZE}" \
     ${MAX_MODEL_LEN:+--max-model-len "${MAX_MODEL_LEN}"} \
+    ${MAX_NUM_SEQS:+--max-num-seqs "${MAX_NUM_SEQS}"} \
     ${VLLM_ARGS}
\ No newline at end of file
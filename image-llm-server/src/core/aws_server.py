@@ -1,19 +1,28 @@
 """Utilities for SQS."""
+import base64
+import io
 import json
 import logging
 import os
+import re
 import signal
 import sys
 import tempfile
+import threading
 import time
-from datetime import datetime
-from typing import Any
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import UTC, datetime
+from typing import Any, BinaryIO
 
 import boto3
+import orjson
+from boto3.s3.transfer import TransferConfig
 
 from core.model_client import ModelClient
 from core.utils.model_utils import get_json_schema, get_system_prompt, get_user_prompt
-from core.utils.video_utils import sample_video_frames
+from core.utils.s3_utils import S3RangedFile
+from core.utils.video_utils import SEEK_MIN_INTERVAL, SamplingOptions, sample_video_jpegs
 
 # Configure logging
 logging.basicConfig(
@@ -27,17 +36,93 @@ OUTPUT_BUCKET = os.getenv("OUTPUT_BUCKET", "ai-chaperone-dev")
 DYNAMO_TABLE = os.getenv("DYNAMO_TABLE", "ai-chaperone-video-moderation-jobs")
 QUEUE_NAME = os.getenv("SQS_QUEUE_NAME", "ai-chaperone-image-processing-queue")
 REGION = os.getenv("AWS_REGION", "us-east-2")
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "10"))
+VISIBILITY_TIMEOUT = int(os.getenv("VISIBILITY_TIMEOUT", "300"))
+VIDEO_HWACCEL = os.getenv("VIDEO_HWACCEL") or None
+# Decoder threads per video; half the cores by default so concurrent jobs don't oversubscribe the CPU
+DECODE_THREADS = int(os.getenv("DECODE_THREADS", str(max(2, (os.cpu_count() or 4) // 2))))
+# Sample only among keyframes, skipping the decode of every P/B-frame
+VIDEO_KEYFRAMES_ONLY = os.getenv("VIDEO_KEYFRAMES_ONLY", "false").lower() in ("1", "true", "yes")
+# Sampling interval (seconds) from which the sampler seeks to each sample; the default 1 fps stays sequential
+VIDEO_SEEK_MIN_INTERVAL = float(os.getenv("VIDEO_SEEK_MIN_INTERVAL", str(SEEK_MIN_INTERVAL)))
+# How sampled frames reach the model: inline "base64" data URLs, or "s3" presigned
+# URLs that the VLLM server fetches itself (the server needs network access to S3)
+FRAME_TRANSPORT = os.getenv("FRAME_TRANSPORT", "base64")
+FRAME_URL_EXPIRES_IN = 900
+FRAME_UPLOAD_WORKERS = 8
+# Frames are already small grayscale thumbnails; quality trades payload size against detail
+FRAME_JPEG_QUALITY = int(os.getenv("FRAME_JPEG_QUALITY", "75"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# JPEG-encode the selected frames on the decoder threads
+SAMPLING_OPTIONS = SamplingOptions(
+    hwaccel=VIDEO_HWACCEL, decode_threads=DECODE_THREADS, keyframes_only=VIDEO_KEYFRAMES_ONLY,
+    seek_min_interval=VIDEO_SEEK_MIN_INTERVAL, encode_workers=DECODE_THREADS, jpeg_quality=FRAME_JPEG_QUALITY,
+)
+
+# Videos up to this size are decoded straight from memory instead of a temp file
+IN_MEMORY_VIDEO_MAX_BYTES = int(os.getenv("IN_MEMORY_VIDEO_MAX_BYTES", str(128 * 1024 * 1024)))
+
+# How videos above IN_MEMORY_VIDEO_MAX_BYTES are read: "download" to VIDEO_TEMP_DIR,
+# "url" to let the decoder stream a presigned URL, or "ranged" to read them through
+# boto3 ranged GETs on demand
+LARGE_VIDEO_SOURCE = os.getenv("LARGE_VIDEO_SOURCE", "download")
+VIDEO_URL_EXPIRES_IN = 3600
+
+# Scratch dir for videos too large for memory. Point it at /dev/shm to stage them in RAM,
+# but only where /dev/shm is sized for MAX_WORKERS large videos (Docker defaults to 64 MB)
+VIDEO_TEMP_DIR = os.getenv("VIDEO_TEMP_DIR") or os.path.join(tempfile.gettempdir(), "video_processing")
+
+# Multipart threshold/chunk size for S3 video downloads
+S3_TRANSFER_CHUNK_SIZE = 8 * 1024 * 1024
+
+# SQS caps both receive_message and delete_message_batch at 10 entries per call
+SQS_BATCH_SIZE = 10
+
+# Marks the video half of a job as complete in DynamoDB
+_DYNAMO_UPDATE_EXPRESSION = "SET video_llm_result_s3_url = :url, video_complete = :complete, updated_at = :time"
+
+# Matches a markdown code fence (optionally tagged json) wrapping the whole reply
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL)
+
+
+def _is_local_file(video_source: str | BinaryIO | None) -> bool:
+    """Return whether the video source is a path on local disk."""
+    return isinstance(video_source, str) and not video_source.startswith(("http://", "https://"))
+
+
+def _loggable_source(video_source: str | BinaryIO) -> str | BinaryIO:
+    """Return the video source with any presigned URL query string (its signature) removed."""
+    if isinstance(video_source, str) and video_source.startswith(("http://", "https://")):
+        return video_source.split("?", 1)[0]
+    return video_source
 
 
 class SQSPollingServer:
     """Server that polls AWS SQS."""
 
-    def __init__(self, queue_name: str, region: str="us-east-2") -> None:
+    def __init__(self, queue_name: str, region: str="us-east-2", max_workers: int=MAX_WORKERS) -> None:
         """Initialize the SQS polling server."""
         self.queue_name = queue_name
         self.region = region
         self.running = True
 
+        # Worker pool for concurrent message processing
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="video-worker")
+        self._in_flight = 0
+        self._capacity = threading.Condition()
+        self._pending_deletes: list[str] = []
+        self._delete_lock = threading.Lock()
+
+        # Receipt handles of in-flight messages, kept hidden by the heartbeat thread
+        self._active_receipts: set[str] = set()
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="visibility-heartbeat", daemon=True)
+
+        # Caps concurrent requests to the LLM server so downloads and frame
+        # sampling of other jobs keep running while the model is saturated
+        self._llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
         # Initialize AWS clients
         self.sqs = boto3.client("sqs", region_name=region)
         self.s3 = boto3.client("s3", region_name=region)
@@ -46,6 +131,22 @@ class SQSPollingServer:
         )
         self.model_client = ModelClient()
 
+        # Prompts and schema are constant for the lifetime of the server
+        self._system_prompt = get_system_prompt()
+        self._user_prompt = get_user_prompt()
+        self._json_schema = get_json_schema()
+        self._base_user_content = [{"type": "text", "text": self._user_prompt}]
+
+        # Large videos are fetched with parallel ranged GETs and streamed to disk
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_TRANSFER_CHUNK_SIZE,
+            multipart_chunksize=S3_TRANSFER_CHUNK_SIZE,
+            max_concurrency=10,
+            use_threads=True,
+        )
+        self.temp_dir = VIDEO_TEMP_DIR
+        os.makedirs(self.temp_dir, exist_ok=True)
+
 
         # Get queue URL
         try:
@@ -72,7 +173,6 @@ class SQSPollingServer:
         Check for validity and get JSON
         """
         if not isinstance(response, dict):
-            logger.error("Invalid LLM response: expected dict, got %s", type(response).__name__)
             logger.error("Invalid LLM response: expected dict, got %s", type(response).__name__)
             return None
 
@@ -96,51 +196,45 @@ class SQSPollingServer:
             logger.error("Invalid LLM response: 'content' missing or empty")
             return None
 
-        logger.info("Raw LLM content: %s", content)
-        logger.info("Stripped LLM content: %s", content[8:-3].strip())
+        logger.debug("Raw LLM content: %s", content)
         try:
-            # if content begins and ends with triple backticks, remove them
-            if content.startswith("```json") and content.endswith("```"):
-                content = content[8:-3].strip()
-            parsed_content = json.loads(content)
-        except json.JSONDecodeError:
+            # if content is wrapped in a code fence, parse only what is inside it
+            match = _CODE_FENCE.match(content)
+            parsed_content = orjson.loads(match.group(1) if match else content)
+        except orjson.JSONDecodeError:
             logger.exception("Failed to parse LLM response content as JSON")
             return None
         else:
             return parsed_content
 
     def analyze_video_for_issues(
-        self, video_path: str,
-        fps: int = 1,
+        self, video_source: str | BinaryIO,
+        fps: float = 1,
         max_frames: int = 50,
+        job_id: str | None = None,
     ) -> list[Any] | None:
         """Analyze a video for any issues by sampling frames and sending them to the model.
 
         Args:
-            video_path (str): Path to the video file to analyze
-            fps (int): frames per second for sampling
+            video_source (str | BinaryIO): Path to the video file or a seekable file-like object
+            fps (float): frames per second for sampling
             max_frames (int): number of frames to sample
+            job_id (str | None): job id used to key uploaded frames when FRAME_TRANSPORT is "s3"
 
         Returns:
             str: Model response about any issues found in the video frames
 
         """
-        logger.info("Analyzing video for issues: %s", video_path)
-
-        client = ModelClient()
+        logger.info("Analyzing video for issues: %s", _loggable_source(video_source))
 
+        # Set once frames are uploaded, so they are deleted however the analysis ends
+        frame_keys: list[str] = []
         try:
             # Sample frames from the video
-            logger.info("Sampling frames from video: %s", video_path)
-
-            # check if the file is there
-            if not os.path.exists(video_path):
-                logger.error("Video file does not exist: %s", video_path)
-                return None
+            logger.info("Sampling frames from video: %s", _loggable_source(video_source))
 
-            sampled_images = sample_video_frames(
-                video_path, fps=fps, max_frames=max_frames,
-            )
+            # Frames come back as JPEG bytes and are base64-encoded only when inlined
+            sampled_images = sample_video_jpegs(video_source, fps=fps, max_frames=max_frames, options=SAMPLING_OPTIONS)
 
             if not sampled_images:
                 logger.error("No frames were sampled from the video")
@@ -148,33 +242,32 @@ class SQSPollingServer:
 
             logger.info("Successfully sampled %s frames", len(sampled_images))
 
+            if FRAME_TRANSPORT == "s3":
+                frame_prefix = f"frames/{job_id or uuid.uuid4()}"
+                frame_keys = [f"{frame_prefix}/{i}.jpg" for i in range(len(sampled_images))]
+                image_urls = self._upload_frames(frame_keys, sampled_images)
+                if image_urls is None:
+                    return None
+            else:
+                prefix = "data:image/jpeg;base64,"
+                image_urls = [prefix + base64.b64encode(image).decode("ascii") for image in sampled_images]
+
             # Prepare messages with the sampled images using VLLM server syntax
+            user_content = list(self._base_user_content)
+            user_content.extend(
+                {"type": "image_url", "image_url": {"url": image_url}} for image_url in image_urls
+            )
             messages = [
-                {
-                    "role": "system",
-                    "content": get_system_prompt(),
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": get_user_prompt(),
-                        },
-                    ] + [
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{image}"},
-                        } for image in sampled_images
-                    ],
-                },
+                {"role": "system", "content": self._system_prompt},
+                {"role": "user", "content": user_content},
             ]
 
             # Send to model for analysis
             logger.info("Sending frames to model for analysis")
-            response = client.chat_completion(
-                messages, temperature=0.3, extra_body={"guided_json": get_json_schema()},
-            )
+            with self._llm_slots:
+                response = self.model_client.chat_completion(
+                    messages, temperature=0.3, extra_body={"guided_json": self._json_schema},
+                )
 
             if not response:
                 logger.error("No response received from model")
@@ -186,6 +279,50 @@ class SQSPollingServer:
         else:
             logger.info("Analysis completed successfully")
             return response
+        finally:
+            # The model has fetched the frames (or never will), so they are no longer needed
+            if frame_keys:
+                self._delete_frames(frame_keys)
+
+    def _upload_frames(self, keys: list[str], frames: list[bytes]) -> list[str] | None:
+        """Upload sampled frames to S3 as JPEGs concurrently and return presigned URLs for the model."""
+        prefix = keys[0].rpartition("/")[0]
+
+        def upload(keyed_frame: tuple[str, bytes]) -> str:
+            key, frame = keyed_frame
+            self.s3.put_object(Bucket=OUTPUT_BUCKET, Key=key, Body=frame, ContentType="image/jpeg")
+            return self.s3.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": OUTPUT_BUCKET, "Key": key},
+                ExpiresIn=FRAME_URL_EXPIRES_IN,
+            )
+
+        try:
+            # A separate small pool; the message executor may be saturated by the jobs themselves
+            with ThreadPoolExecutor(max_workers=min(FRAME_UPLOAD_WORKERS, len(frames))) as pool:
+                urls = list(pool.map(upload, zip(keys, frames, strict=True)))
+        except Exception:
+            logger.exception("Failed to upload frames to %s", f"s3://{OUTPUT_BUCKET}/{prefix}")
+            return None
+        else:
+            logger.info("Uploaded %s frames to %s", len(urls), f"s3://{OUTPUT_BUCKET}/{prefix}")
+            return urls
+
+    def _delete_frames(self, keys: list[str]) -> None:
+        """Delete uploaded frames from S3, up to 1000 per call."""
+        for i in range(0, len(keys), 1000):
+            batch = keys[i:i + 1000]
+            try:
+                response = self.s3.delete_objects(
+                    Bucket=OUTPUT_BUCKET,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+            except Exception:
+                # Leftovers are only storage; a lifecycle rule on frames/ catches them
+                logger.exception("Failed to delete %s uploaded frames", len(batch))
+                continue
+            for error in response.get("Errors", []):
+                logger.error("Failed to delete frame %s: %s", error.get("Key"), error.get("Message"))
 
     def process_message(self, message_body: str) -> bool:
         """Parent function that orchestrates processing of a single message."""
@@ -199,13 +336,13 @@ class SQSPollingServer:
         logger.info("Processing job: %s", job_id)
         logger.info("Video URL: %s", video_s3_url)
 
-        video_path = self._download_video(s3_url=video_s3_url, job_id=job_id)
-        if video_path is None:
+        video_source = self._open_video(s3_url=video_s3_url, job_id=job_id)
+        if video_source is None:
             return False
 
         try:
-            logger.info("Calling analyze_video_for_issues with path: %s", video_path)
-            response = self.analyze_video_for_issues(video_path=video_path)
+            logger.info("Calling analyze_video_for_issues with source: %s", _loggable_source(video_source))
+            response = self.analyze_video_for_issues(video_source=video_source, job_id=job_id)
             if response is None:
                 return False
 
@@ -214,7 +351,8 @@ class SQSPollingServer:
                 logger.error("Failed to parse LLM response")
                 return False
 
-            logger.info("LLM Result: %s", json.dumps(llm_result, indent=2))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("LLM Result: %s", json.dumps(llm_result, indent=2))
             logger.info("Successfully processed job: %s", job_id)
 
             s3_url = self._save_result_to_s3(job_id, llm_result)
@@ -224,18 +362,27 @@ class SQSPollingServer:
             return self._update_dynamo(job_id, s3_url)
 
         finally:
-            try:
-                if video_path and os.path.exists(video_path):
-                    os.remove(video_path)
-                    logger.info("Deleted temporary video: %s", video_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temporary video {video_path}: {e}")
+            self._cleanup_video(video_source)
+
+    def _cleanup_video(self, video_source: str | BinaryIO) -> None:
+        """Delete the temporary file behind a video source, if it has one."""
+        # Only videos too large for memory leave a temporary file behind
+        if not _is_local_file(video_source):
+            return
+        try:
+            os.remove(video_source)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Failed to delete temporary video %s: %s", video_source, e)
+        else:
+            logger.info("Deleted temporary video: %s", video_source)
 
     def _parse_message(self, message_body: str) -> dict[str, Any] | None:
         """Parse and validate incoming message JSON."""
         try:
-            data = json.loads(message_body)
-        except json.JSONDecodeError:
+            data = orjson.loads(message_body)
+        except orjson.JSONDecodeError:
             logger.exception("Failed to parse message JSON")
             return None
 
@@ -248,8 +395,15 @@ class SQSPollingServer:
 
         return {"job_id": job_id, "video_s3_url": video_s3_url}
 
-    def _download_video(self, s3_url: str, job_id: str | None = None) -> str | None:
-        """Download video content from S3."""
+    def _open_video(self, s3_url: str, job_id: str | None = None) -> str | BinaryIO | None:
+        """Open video content from S3 for frame sampling.
+
+        Videos up to IN_MEMORY_VIDEO_MAX_BYTES are read into memory and handed to the
+        decoder directly, skipping the temp file write and re-read. Larger videos are
+        either downloaded to disk or, depending on LARGE_VIDEO_SOURCE, streamed by the
+        decoder from a presigned URL or a ranged S3 reader, so memory stays bounded
+        across concurrent jobs.
+        """
         bucket, key = self._parse_s3_url(s3_url)
         if not bucket or not key:
             logger.error("Invalid S3 URL format: %s", s3_url)
@@ -257,16 +411,54 @@ class SQSPollingServer:
 
         try:
             response = self.s3.get_object(Bucket=bucket, Key=key)
-            # Save the video to a temporary file
-            # Create a temporary directory for video files
-            temp_dir = os.path.join(tempfile.gettempdir(), "video_processing")
-            os.makedirs(temp_dir, exist_ok=True)
+            if response["ContentLength"] <= IN_MEMORY_VIDEO_MAX_BYTES:
+                # MP4 demuxing needs to seek, so the body is buffered rather than streamed
+                return io.BytesIO(response["Body"].read())
+            response["Body"].close()
+        except Exception:
+            logger.exception("Failed to download video from %s", f"s3://{bucket}/{key}")
+            return None
+
+        if LARGE_VIDEO_SOURCE == "ranged":
+            logger.info("Video larger than %s bytes, reading with ranged GETs", IN_MEMORY_VIDEO_MAX_BYTES)
+            return S3RangedFile(
+                self.s3, bucket, key, size=response["ContentLength"], etag=response.get("ETag"),
+                chunk_size=S3_TRANSFER_CHUNK_SIZE,
+            )
+
+        if LARGE_VIDEO_SOURCE == "url":
+            logger.info("Video larger than %s bytes, streaming from S3", IN_MEMORY_VIDEO_MAX_BYTES)
+            return self._presign_video_url(bucket, key)
+
+        logger.info("Video larger than %s bytes, downloading to disk", IN_MEMORY_VIDEO_MAX_BYTES)
+        return self._download_video(s3_url=s3_url, job_id=job_id)
+
+    def _presign_video_url(self, bucket: str, key: str) -> str | None:
+        """Presign a GET of the video so the decoder can stream it over HTTPS."""
+        try:
+            return self.s3.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": bucket, "Key": key},
+                ExpiresIn=VIDEO_URL_EXPIRES_IN,
+            )
+        except Exception:
+            logger.exception("Failed to presign video URL for %s", f"s3://{bucket}/{key}")
+            return None
 
+    def _download_video(self, s3_url: str, job_id: str | None = None) -> str | None:
+        """Download video content from S3."""
+        bucket, key = self._parse_s3_url(s3_url)
+        if not bucket or not key:
+            logger.error("Invalid S3 URL format: %s", s3_url)
+            return None
+
+        try:
             # Use job_id for filename with original extension
             file_extension = os.path.splitext(key)[-1] or ".mp4"
-            video_path = os.path.join(temp_dir, f"{job_id}{file_extension}")
-            with open(video_path, "wb") as f:
-                f.write(response["Body"].read())
+            video_path = os.path.join(self.temp_dir, f"{job_id}{file_extension}")
+
+            # Stream the video straight to disk instead of buffering it in memory
+            self.s3.download_file(Bucket=bucket, Key=key, Filename=video_path, Config=self.transfer_config)
 
         except Exception:
             logger.exception("Failed to download video from %s", f"s3://{bucket}/{key}")
@@ -283,18 +475,20 @@ class SQSPollingServer:
         """Build messages for the LLM call."""
         try:
             user_prompt = get_user_prompt(output_type=request_type)
-            return [
-                {"role": "system", "content": get_system_prompt()},
-                {"role": "user", "content": user_prompt},
-            ]
         except Exception:
             logger.exception("Failed to build prompts")
             return None
+        else:
+            return [
+                {"role": "system", "content": self._system_prompt},
+                {"role": "user", "content": user_prompt},
+            ]
 
     def _call_llm(self, messages: list[dict[Any, Any]]) -> list[Any] | None:
         """Call the LLM and return raw response."""
         try:
-            return self.model_client.chat_completion(messages, temperature=0.3)
+            with self._llm_slots:
+                return self.model_client.chat_completion(messages, temperature=0.3)
         except Exception:
             logger.exception("LLM call failed")
             return None
@@ -309,7 +503,7 @@ class SQSPollingServer:
             self.s3.put_object(
                 Bucket=OUTPUT_BUCKET,
                 Key=result_key,
-                Body=json.dumps(llm_result).encode("utf-8"),
+                Body=orjson.dumps(llm_result),
                 ContentType="application/json",
             )
             url = f"s3://{OUTPUT_BUCKET}/{result_key}"
@@ -322,16 +516,14 @@ class SQSPollingServer:
 
     def _update_dynamo(self, job_id: str, result_s3_url: str) -> bool:
         """Update DynamoDB with job status and result location."""
-        url_var = "video_llm_result_s3_url"
-        is_complete = True
         try:
             self.dynamo_table.update_item(
                 Key={"job_id": job_id},
-                UpdateExpression=f"SET {url_var} = :url, video_complete = :complete, updated_at = :time",
+                UpdateExpression=_DYNAMO_UPDATE_EXPRESSION,
                 ExpressionAttributeValues={
                     ":url": result_s3_url,
-                    ":complete": is_complete,
-                    ":time": datetime.utcnow().isoformat(),
+                    ":complete": True,
+                    ":time": datetime.now(UTC).isoformat(),
                 },
             )
             logger.info("DynamoDB updated for job_id: %s", job_id)
@@ -341,16 +533,109 @@ class SQSPollingServer:
         else:
             return True
 
+    def _queue_delete(self, receipt_handle: str) -> None:
+        """Queue a receipt handle for deletion, flushing once a full batch is pending."""
+        with self._delete_lock:
+            self._pending_deletes.append(receipt_handle)
+            if len(self._pending_deletes) < SQS_BATCH_SIZE:
+                return
+            batch = self._pending_deletes[:SQS_BATCH_SIZE]
+            del self._pending_deletes[:SQS_BATCH_SIZE]
+        self._delete_batch(batch)
+
+    def _flush_deletes(self) -> None:
+        """Delete all pending messages from the queue."""
+        with self._delete_lock:
+            pending = self._pending_deletes
+            self._pending_deletes = []
+        for i in range(0, len(pending), SQS_BATCH_SIZE):
+            self._delete_batch(pending[i:i + SQS_BATCH_SIZE])
+
+    def _delete_batch(self, receipt_handles: list[str]) -> None:
+        """Delete up to 10 messages from the queue in a single call."""
+        try:
+            response = self.sqs.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(i), "ReceiptHandle": handle} for i, handle in enumerate(receipt_handles)],
+            )
+        except Exception:
+            # Messages will become visible again after VisibilityTimeout
+            logger.exception("Failed to delete %s message(s) from queue", len(receipt_handles))
+            return
+
+        for failure in response.get("Failed", []):
+            logger.error("Failed to delete message %s: %s", failure.get("Id"), failure.get("Message"))
+        logger.info("Deleted %s message(s) from queue", len(response.get("Successful", [])))
+
+    def _extend_visibility(self, receipt_handles: list[str]) -> None:
+        """Reset the visibility timeout of up to 10 in-flight messages in a single call."""
+        try:
+            response = self.sqs.change_message_visibility_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": handle, "VisibilityTimeout": VISIBILITY_TIMEOUT}
+                    for i, handle in enumerate(receipt_handles)
+                ],
+            )
+        except Exception:
+            logger.exception("Failed to extend visibility of %s message(s)", len(receipt_handles))
+            return
+
+        for failure in response.get("Failed", []):
+            logger.error("Failed to extend visibility of message %s: %s", failure.get("Id"), failure.get("Message"))
+
+    def _heartbeat_loop(self) -> None:
+        """Keep in-flight messages hidden until their jobs finish, however long they take."""
+        interval = max(VISIBILITY_TIMEOUT // 2, 1)
+        while not self._heartbeat_stop.wait(interval):
+            with self._capacity:
+                receipt_handles = list(self._active_receipts)
+            for i in range(0, len(receipt_handles), SQS_BATCH_SIZE):
+                self._extend_visibility(receipt_handles[i:i + SQS_BATCH_SIZE])
+
+    def _on_message_done(self, future: Future, receipt_handle: str) -> None:
+        """Release the worker slot and queue the message for deletion if it succeeded."""
+        with self._capacity:
+            self._in_flight -= 1
+            self._active_receipts.discard(receipt_handle)
+            self._capacity.notify()
+
+        if future.cancelled():
+            return
+
+        try:
+            success = future.result()
+        except Exception:
+            logger.exception("Unhandled error processing message")
+            success = False
+
+        if success:
+            self._queue_delete(receipt_handle)
+        else:
+            # Message will become visible again after VisibilityTimeout
+            logger.warning("Message processing failed, will retry later")
+
+    def _wait_for_capacity(self) -> int:
+        """Block until a worker is free and return the number of free workers."""
+        with self._capacity:
+            while self.running and self._in_flight >= self.max_workers:
+                self._capacity.wait(timeout=1)
+            return self.max_workers - self._in_flight
+
     def poll_queue(self) -> None:
         """Poll the SQS queue for messages."""
         while self.running:
             try:
+                free_workers = self._wait_for_capacity()
+                if not self.running:
+                    break
+
                 # Long polling with 20 second wait time
                 response = self.sqs.receive_message(
                     QueueUrl=self.queue_url,
-                    MaxNumberOfMessages=1,  # Process up to 1 message at once
+                    MaxNumberOfMessages=min(free_workers, SQS_BATCH_SIZE),
                     WaitTimeSeconds=20,  # Long polling
-                    VisibilityTimeout=60,  # 1 minute to process
+                    VisibilityTimeout=VISIBILITY_TIMEOUT,  # Extended by the heartbeat while processing
                 )
 
                 messages = response.get("Messages", [])
@@ -359,22 +644,22 @@ class SQSPollingServer:
                     logger.info("Received %s message(s)", len(messages))
 
                     for message in messages:
-                        # Process the message
-                        success = self.process_message(message["Body"])
-
-                        if success:
-                            # Delete message from queue after successful processing
-                            self.sqs.delete_message(
-                                QueueUrl=self.queue_url,
-                                ReceiptHandle=message["ReceiptHandle"]
-                            )
-                            logger.info("Message deleted from queue")
-                        else:
-                            # Message will become visible again after VisibilityTimeout
-                            logger.warning("Message processing failed, will retry later")
+                        if not self.running:
+                            # Unsubmitted messages become visible again after VisibilityTimeout
+                            break
+                        with self._capacity:
+                            self._in_flight += 1
+                            self._active_receipts.add(message["ReceiptHandle"])
+                        future = self.executor.submit(self.process_message, message["Body"])
+                        future.add_done_callback(
+                            lambda f, handle=message["ReceiptHandle"]: self._on_message_done(f, handle),
+                        )
                 else:
                     logger.debug("No messages in queue")
 
+                # Deletes for partially filled batches go out once per poll cycle
+                self._flush_deletes()
+
             except KeyboardInterrupt:
                 logger.info("Received interrupt signal")
                 self.shutdown()
@@ -386,6 +671,8 @@ class SQSPollingServer:
         """Gracefully shutdown the server."""
         logger.info("Shutting down server...")
         self.running = False
+        # Jobs that have not started are dropped and will be redelivered by SQS
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
     def run(self) -> None:
         """Start the polling server."""
@@ -397,8 +684,15 @@ class SQSPollingServer:
         signal.signal(signal.SIGTERM, lambda s, f: self.shutdown())
 
         # Start polling
+        self._heartbeat.start()
         self.poll_queue()
 
+        # Let in-flight jobs finish and clean up their messages
+        self.executor.shutdown(wait=True)
+        self._heartbeat_stop.set()
+        self._heartbeat.join()
+        self._flush_deletes()
+
         logger.info("Server stopped")
 
 
@@ -3,7 +3,9 @@ import logging
 import os
 from typing import Any
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -11,12 +13,29 @@ logger = logging.getLogger(__name__)
 class ModelClient:
     """Create client to send requests to the vLLM server."""
 
-    def __init__(self, url: str | None= None, timeout: int= 120) -> None:
+    def __init__(
+        self,
+        url: str | None= None,
+        timeout: int= 120,
+        pool_size: int = 32,
+        connect_timeout: float = 5.0,
+    ) -> None:
         """Initialize client."""
         if url is None:
             url = os.getenv("VLLM_URL", "http://localhost:8000")
         self.url = f"{url}/v1/chat/completions"
         self.timeout = timeout
+        self.connect_timeout = connect_timeout
+
+        # One keep-alive pool shared by every worker thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+                "Content-Type": "application/json",
+                "Authorization": "Bearer no-key",
+                })
         logger.info("Initialized client for %s", url)
 
     def chat_completion(self, messages: list[Any], **kwargs: dict[str, Any]) -> list[Any] | None:
@@ -26,16 +45,13 @@ class ModelClient:
                 **kwargs,
                 }
 
-        headers = {
-                "Content-Type": "application/json",
-                "Authorization": "Bearer no-key",
-                }
-
         try:
             logger.info("Sending chat completion request...")
-            response = requests.post(self.url, headers=headers, json=payload, timeout=self.timeout)
+            response = self.session.post(
+                self.url, data=orjson.dumps(payload), timeout=(self.connect_timeout, self.timeout),
+            )
             response.raise_for_status()
-            result = response.json()
+            result = orjson.loads(response.content)
             logger.info("Received response")
 
         except Exception:
@@ -0,0 +1,108 @@
+"""Utilities for reading S3 objects."""
+import io
+from collections import OrderedDict
+from typing import Any
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class S3RangedFile(io.RawIOBase):
+    """Seekable, read-only file over an S3 object that fetches byte ranges on demand.
+
+    Only the chunks the reader touches are downloaded, and the most recently used ones
+    are kept in memory, so a decoder seeking to sparse timestamps never pulls the whole
+    object and never needs a local copy.
+    """
+
+    def __init__(self,  # noqa: PLR0913
+                 s3_client: Any,  # noqa: ANN401
+                 bucket: str,
+                 key: str,
+                 size: int,
+                 *,
+                 etag: str | None = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_chunks: int = 4) -> None:
+        """Initialize the reader.
+
+        Args:
+            s3_client: boto3 S3 client used for the ranged GETs
+            bucket: Bucket of the object
+            key: Key of the object
+            size: Object size in bytes (ContentLength)
+            etag: If set, every range request fails once the object changes
+            chunk_size: Bytes fetched per range request
+            max_chunks: Number of chunks kept cached in memory
+
+        """
+        super().__init__()
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self._pos = 0
+        self._chunks: OrderedDict[int, bytes] = OrderedDict()
+
+    def readable(self) -> bool:
+        """Return True; the object can be read."""
+        return True
+
+    def seekable(self) -> bool:
+        """Return True; any offset can be fetched."""
+        return True
+
+    def tell(self) -> int:
+        """Return the current position."""
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """Move to a new position without fetching anything."""
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            msg = f"Invalid whence {whence}"
+            raise ValueError(msg)
+        if pos < 0:
+            msg = f"Negative seek position {pos}"
+            raise ValueError(msg)
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer: Any) -> int:  # noqa: ANN401
+        """Fill buffer from the current position, crossing chunk boundaries as needed."""
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view) and self._pos < self.size:
+            index, offset = divmod(self._pos, self.chunk_size)
+            chunk = self._get_chunk(index)
+            n = min(len(view) - filled, len(chunk) - offset)
+            view[filled:filled + n] = chunk[offset:offset + n]
+            filled += n
+            self._pos += n
+        return filled
+
+    def _get_chunk(self, index: int) -> bytes:
+        """Return a chunk from the cache, fetching it with a ranged GET on a miss."""
+        chunk = self._chunks.get(index)
+        if chunk is not None:
+            self._chunks.move_to_end(index)
+            return chunk
+
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size) - 1
+        params = {"Bucket": self.bucket, "Key": self.key, "Range": f"bytes={start}-{end}"}
+        if self.etag:
+            params["IfMatch"] = self.etag
+        chunk = self.s3.get_object(**params)["Body"].read()
+
+        self._chunks[index] = chunk
+        if len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
+        return chunk
@@ -1,12 +1,103 @@
 """Utilities for video frame sampling."""
 import base64
+import heapq
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
 from io import BytesIO
-from typing import Any
+from typing import Any, BinaryIO
 
 import av
 import numpy as np
+from av.codec.hwaccel import HWAccel
+from av.video.reformatter import Interpolation, VideoReformatter
 from PIL import Image
 
+# Sampling intervals (seconds) at or above which seeking to each sample beats decoding every frame
+SEEK_MIN_INTERVAL = 4.0
+
+
+def _video_duration(container: av.container.InputContainer, video_stream: av.VideoStream) -> float | None:
+    """Return the video duration in seconds, or None if the container does not report it."""
+    if video_stream.duration is not None and video_stream.time_base is not None:
+        return float(video_stream.duration * video_stream.time_base)
+    if container.duration is not None:
+        return container.duration / av.time_base
+    return None
+
+def _decode_sampled_frames(container: av.container.InputContainer,
+                           video_stream: av.VideoStream,
+                           frame_interval: float) -> Iterator[av.VideoFrame]:
+    """Decode every frame and yield the first one at or after each sample time."""
+    next_sample_time = 0.0
+    for packet in container.demux(video_stream):
+        for frame in packet.decode():
+            if frame.pts is None or video_stream.time_base is None:
+                continue
+
+            if float(frame.pts * video_stream.time_base) >= next_sample_time:
+                yield frame
+                next_sample_time += frame_interval
+
+def _seek_sampled_frames(container: av.container.InputContainer,
+                         video_stream: av.VideoStream,
+                         frame_interval: float,
+                         duration: float) -> Iterator[av.VideoFrame]:
+    """Seek to the keyframe before each sample time and decode only up to the sample.
+
+    Frames between samples are never decoded past the nearest preceding keyframe.
+    """
+    time_base = video_stream.time_base
+    target = 0.0
+    while target <= duration:
+        container.seek(int(target / time_base), stream=video_stream, any_frame=False, backward=True)
+        for frame in container.decode(video_stream):
+            if frame.pts is None:
+                continue
+            current_time = float(frame.pts * time_base)
+            if current_time >= target:
+                yield frame
+                break
+        else:
+            return
+
+        # Skip targets that this frame already covers so it is not sampled twice
+        target += frame_interval
+        while target <= current_time:
+            target += frame_interval
+
+
+@dataclass(frozen=True)
+class SamplingOptions:
+    """Decode and encode settings for sample_video_jpegs.
+
+    Attributes:
+        hwaccel: Hardware decoder device type (e.g. "cuda" for NVDEC), or None for software decode.
+            Falls back to software decode for codecs the device cannot handle.
+        decode_threads: Number of frame/slice decoding threads, or 0 to let FFmpeg pick one per core
+        keyframes_only: Decode only keyframes (I-frames) and sample among them. Much faster on long
+            videos, at the cost of samples landing on the first keyframe at or after each sample time
+        seek_min_interval: Sampling interval (seconds) at or above which each sample is reached by seeking
+            instead of decoding every frame
+        encode_workers: Number of threads encoding the selected frames to JPEG
+        jpeg_quality: JPEG quality (1-95) of the returned frames; lower values shrink the model payload
+
+    """
+
+    hwaccel: str | None = None
+    decode_threads: int = 0
+    keyframes_only: bool = False
+    seek_min_interval: float = SEEK_MIN_INTERVAL
+    encode_workers: int = 1
+    jpeg_quality: int = 75
+
+
+def encode_jpeg(frame_array: np.ndarray, quality: int = 75) -> bytes:
+    """Encode a frame array as JPEG bytes."""
+    buffer = BytesIO()
+    Image.fromarray(frame_array).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
 
 def pil_to_base64(pil_image: Image.Image) -> str:
     """Convert PIL image to b64."""
@@ -14,8 +105,114 @@ def pil_to_base64(pil_image: Image.Image) -> str:
     pil_image.save(buffer, format="JPEG")
     return base64.b64encode(buffer.getvalue()).decode("utf-8")
 
-def sample_video_frames(video_path: str,
-                        fps: int= 2,
+def _open_video(video_path: str | BinaryIO, options: SamplingOptions) -> av.container.InputContainer:
+    """Open the video and configure its first video stream for decoding."""
+    if options.hwaccel:
+        hwaccel = HWAccel(device_type=options.hwaccel, allow_software_fallback=True)
+        container = av.open(video_path, hwaccel=hwaccel)
+    else:
+        container = av.open(video_path)
+    video_stream = container.streams.video[0]
+    video_stream.thread_type = "AUTO"
+    video_stream.codec_context.thread_count = options.decode_threads
+    if options.keyframes_only:
+        # The decoder drops non-key frames itself, so P/B-frames are never reconstructed
+        video_stream.codec_context.skip_frame = "NONKEY"
+    return container
+
+def _sampled_frames(container: av.container.InputContainer,
+                    fps: float,
+                    options: SamplingOptions) -> Iterator[av.VideoFrame]:
+    """Yield one frame per sample time, seeking between samples when they are sparse enough."""
+    video_stream = container.streams.video[0]
+    frame_interval = 1.0 / fps
+    duration = _video_duration(container, video_stream)
+    if frame_interval >= options.seek_min_interval and duration is not None:
+        return _seek_sampled_frames(container, video_stream, frame_interval, duration)
+    return _decode_sampled_frames(container, video_stream, frame_interval)
+
+def _top_changed_frames(frames: Iterator[av.VideoFrame], max_frames: int, img_size: tuple) -> list[np.ndarray]:
+    """Return the grayscale thumbnails of the max_frames frames that differ most from their predecessor."""
+    # Min-heap of the max_frames largest (diff, -index, frame) so only the top frames stay in memory
+    top_k: list[tuple[int, int, np.ndarray]] = []
+    prev_frame = None
+    diff_buffer = None
+    thumb_size = None
+    # One reformatter for the whole video so swscale context setup is not repeated per frame
+    reformatter = VideoReformatter()
+
+    for frame_count, frame in enumerate(frames):
+        # Scale and convert to grayscale in one swscale pass, keeping the aspect ratio
+        if thumb_size is None:
+            scale = min(img_size[0] / frame.width, img_size[1] / frame.height, 1.0)
+            thumb_size = (max(round(frame.width * scale), 1), max(round(frame.height * scale), 1))
+        frame_array = reformatter.reformat(
+            frame, width=thumb_size[0], height=thumb_size[1], format="gray8", interpolation=Interpolation.AREA,
+        ).to_ndarray()
+
+        if prev_frame is not None:
+            # Integer sum of absolute differences, reusing one int16 buffer across frames
+            if diff_buffer is None or diff_buffer.shape != frame_array.shape:
+                diff_buffer = np.empty(frame_array.shape, dtype=np.int16)
+            np.subtract(prev_frame, frame_array, out=diff_buffer, dtype=np.int16)
+            diff = int(np.abs(diff_buffer, out=diff_buffer).sum(dtype=np.int64))
+            entry = (diff, -frame_count, frame_array)
+            if len(top_k) < max_frames:
+                heapq.heappush(top_k, entry)
+            elif top_k and entry > top_k[0]:
+                heapq.heapreplace(top_k, entry)
+
+        prev_frame = frame_array
+
+    # Largest change first; ties keep the earlier frame first
+    top_k.sort(reverse=True)
+    return [frame_array for _, _, frame_array in top_k]
+
+def _select_frames(video_path: str | BinaryIO,
+                   fps: float,
+                   max_frames: int,
+                   img_size: tuple,
+                   options: SamplingOptions) -> list[np.ndarray]:
+    """Decode the video and return the thumbnails of its most visually different frames."""
+    container = _open_video(video_path, options)
+    try:
+        return _top_changed_frames(_sampled_frames(container, fps, options), max_frames, img_size)
+    finally:
+        container.close()
+
+def _encode_frames(frame_arrays: list[np.ndarray], options: SamplingOptions) -> list[bytes]:
+    """Encode the frames to JPEG, on a thread pool when more than one encode worker is allowed."""
+    encode = partial(encode_jpeg, quality=options.jpeg_quality)
+    if options.encode_workers > 1 and len(frame_arrays) > 1:
+        # Pillow releases the GIL while encoding, so the frames encode in parallel
+        with ThreadPoolExecutor(max_workers=min(options.encode_workers, len(frame_arrays))) as pool:
+            return list(pool.map(encode, frame_arrays))
+    return [encode(frame_array) for frame_array in frame_arrays]
+
+def sample_video_jpegs(video_path: str | BinaryIO,
+                       fps: float = 2,
+                       max_frames: int = 10,
+                       img_size: tuple = (512, 288),
+                       *,
+                       options: SamplingOptions | None = None) -> list[bytes]:
+    """Sample the frames with the biggest visual changes and return them as raw JPEG bytes.
+
+    Args:
+        video_path: Path or URL of the video file, or a seekable file-like object
+        fps: Target Sampling rate (frames per second)
+        max_frames: Maximum number of frames to return
+        img_size: Size to resize the image for sampling
+        options: Decode and encode settings, or None for the defaults
+
+    Returns:
+        List of JPEG bytes of the most visually different frames
+
+    """
+    options = options or SamplingOptions()
+    return _encode_frames(_select_frames(video_path, fps, max_frames, img_size, options), options)
+
+def sample_video_frames(video_path: str | BinaryIO,
+                        fps: float = 2,
                         max_frames: int = 10,
                         img_size: tuple = (512, 288),
                         *,
@@ -23,56 +220,18 @@ def sample_video_frames(video_path: str,
     """Sample frames from video that have the biggest visual changes.
 
     Args:
-        video_path: Path to video file
+        video_path: Path or URL of the video file, or a seekable file-like object
         fps: Target Sampling rate (frames per second)
         max_frames: Maximum number of frames to return
         img_size: Size to resize the image for sampling
         convert_b64: To return in base64 format or not
 
     Returns:
-        List of PIL Images of the most visually different frames
+        List of base64 JPEG strings (if convert_b64) or PIL Images of the most visually different frames
 
     """
-    container = av.open(video_path)
-    video_stream = container.streams.video[0]
-
-    frame_interval = 1.0 / fps
-
-    frames = []
-    differences = []
-    prev_frame = None
-    next_sample_time = 0.0
-
-    try:
-        for packet in container.demux(video_stream):
-            for frame in packet.decode():
-
-                if frame.pts is None or video_stream.time_base is None:
-                    continue
-
-                current_time = float(frame.pts * video_stream.time_base)
-
-                if current_time >= next_sample_time:
-                    img = frame.to_image().convert("L")
-                    img.thumbnail(img_size)
-                    frame_array = np.array(img)
-
-                    if prev_frame is not None:
-                        diff = np.sum(np.abs(prev_frame.astype(np.float32) - frame_array.astype(np.float32)))
-                        differences.append((len(frames), diff, img))
-
-                    frames.append(frame_array)
-                    prev_frame = frame_array
-                    next_sample_time += frame_interval
-
-    finally:
-        container.close()
-
-    if not differences:
-        return []
-
-    differences.sort(key=lambda x: x[1], reverse=True)
-    top_frames = [img for _, _, img in differences[:max_frames]]
     if convert_b64:
-        return [pil_to_base64(frame) for frame in top_frames]
-    return top_frames
+        frames = sample_video_jpegs(video_path, fps, max_frames, img_size)
+        return [base64.b64encode(frame).decode("ascii") for frame in frames]
+    frame_arrays = _select_frames(video_path, fps, max_frames, img_size, SamplingOptions())
+    return [Image.fromarray(frame_array) for frame_array in frame_arrays]
@@ -1,4 +1,5 @@
 import argparse  # noqa: D100, INP001
+import functools
 import logging
 import sys
 from typing import Any
@@ -13,9 +14,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@functools.cache
+def get_client() -> ModelClient:
+    """Return one shared ModelClient so repeated calls reuse its pooled keep-alive connection."""
+    return ModelClient()
+
 def analyze_video_for_issues(video_path: str, fps: int=1,  max_frames: int=50) -> list[Any] | None:
     """Analyze a video for any issues by sampling frames and sending them to the model."""
-    client = ModelClient()
+    client = get_client()
 
     try:
         # Sample frames from the video
@@ -29,25 +35,14 @@ def analyze_video_for_issues(video_path: str, fps: int=1,  max_frames: int=50) -
         logger.info("Successfully sampled %s frames", len(sampled_images))
 
         # Prepare messages with the sampled images using VLLM server syntax
+        prefix = "data:image/jpeg;base64,"
+        user_content = [{"type": "text", "text": get_user_prompt()}]
+        user_content.extend(
+            {"type": "image_url", "image_url": {"url": prefix + image}} for image in sampled_images
+        )
         messages = [
-            {
-                "role": "system",
-                "content": get_system_prompt(),
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": get_user_prompt(),
-                    },
-                ] + [
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image}"},
-                    } for image in sampled_images
-                ],
-            },
+            {"role": "system", "content": get_system_prompt()},
+            {"role": "user", "content": user_content},
         ]
 
         # Send to model for analysis
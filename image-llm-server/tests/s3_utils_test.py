@@ -0,0 +1,66 @@
+"""Checks for S3RangedFile against an in-memory stand-in for the S3 client."""  # noqa: INP001
+# ruff: noqa: S101, PLR2004
+import io
+from typing import Any
+
+from core.utils.s3_utils import S3RangedFile
+
+DATA = bytes(range(256)) * 4
+CHUNK_SIZE = 100
+
+
+class FakeS3:
+    """Serves get_object(Range=...) from DATA and records every requested range."""
+
+    def __init__(self) -> None:
+        """Start with no requests."""
+        self.ranges: list[str] = []
+
+    def get_object(self, **params: Any) -> dict[str, Any]:  # noqa: ANN401
+        """Return the requested byte range, inclusive as in HTTP."""
+        self.ranges.append(params["Range"])
+        start, end = map(int, params["Range"].removeprefix("bytes=").split("-"))
+        return {"Body": io.BytesIO(DATA[start:end + 1])}
+
+
+def make_file(max_chunks: int = 4) -> tuple[S3RangedFile, FakeS3]:
+    """Return a ranged file over DATA and the fake client behind it."""
+    s3 = FakeS3()
+    return S3RangedFile(s3, "bucket", "key", len(DATA), chunk_size=CHUNK_SIZE, max_chunks=max_chunks), s3
+
+
+def test_read_across_chunk_boundaries() -> None:
+    """A read spanning several chunks returns the same bytes as the object."""
+    f, s3 = make_file()
+    f.seek(95)
+    assert f.read(210) == DATA[95:305]
+    assert f.tell() == 305
+    assert s3.ranges == ["bytes=0-99", "bytes=100-199", "bytes=200-299", "bytes=300-399"]
+
+
+def test_seek_whence_and_end_of_object() -> None:
+    """SEEK_CUR and SEEK_END move relative to the position and size; reads stop at the end."""
+    f, _ = make_file()
+    f.seek(10)
+    f.seek(5, io.SEEK_CUR)
+    assert f.read(3) == DATA[15:18]
+    f.seek(-4, io.SEEK_END)
+    assert f.read(10) == DATA[-4:]
+    assert f.read(10) == b""
+
+
+def test_readinto_reuses_cached_chunks() -> None:
+    """Rereading within cached chunks fetches nothing, and evicted chunks are fetched again."""
+    f, s3 = make_file(max_chunks=2)
+    buffer = bytearray(150)
+    assert f.readinto(buffer) == 150
+    assert bytes(buffer) == DATA[:150]
+    f.seek(0)
+    f.readinto(buffer)
+    assert len(s3.ranges) == 2
+
+    f.seek(250)
+    f.read(1)
+    f.seek(0)
+    f.read(1)
+    assert s3.ranges[-2:] == ["bytes=200-299", "bytes=0-99"]
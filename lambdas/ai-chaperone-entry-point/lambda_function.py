@@ -2,8 +2,9 @@ import json
 import uuid
 import boto3
 import os
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from urllib.parse import urlparse
 
 TABLE_NAME = os.environ.get('DYNAMO_TABLE_NAME')
 RULES_QUEUE_URL = os.environ.get('RULES_QUEUE_URL')
@@ -14,14 +15,16 @@ sqs = boto3.client('sqs')
 s3 = boto3.client('s3')
 table = dynamodb.Table(TABLE_NAME)
 
+# Kept across warm invocations so each request doesn't spin up fresh threads
+executor = ThreadPoolExecutor(max_workers=2)
+
 def parse_s3_url(s3_url):
     """Parse S3 URL and return bucket and key"""
     if not s3_url.startswith('s3://'):
         raise ValueError(f"Invalid S3 URL format: {s3_url}")
     
-    parsed = urlparse(s3_url)
-    bucket = parsed.netloc
-    key = parsed.path.lstrip('/')
+    bucket, _, key = s3_url[5:].partition('/')
+    key = key.lstrip('/')
     
     if not bucket or not key:
         raise ValueError(f"Invalid S3 URL: {s3_url}")
@@ -35,15 +38,23 @@ def validate_s3_files(transcript_url, video_url):
     """
     try:
         transcript_bucket, transcript_key = parse_s3_url(transcript_url)
-        s3.head_object(Bucket=transcript_bucket, Key=transcript_key)
-        
         video_bucket, video_key = parse_s3_url(video_url)
-        video_response = s3.head_object(Bucket=video_bucket, Key=video_key)
+        
+        # Both checks are independent, so their round-trips overlap
+        checks = [
+            executor.submit(s3.head_object, Bucket=transcript_bucket, Key=transcript_key),
+            executor.submit(s3.head_object, Bucket=video_bucket, Key=video_key)
+        ]
+        for check in checks:
+            check.result()
 
         return True, None
         
-    except s3.exceptions.NoSuchKey as e:
-        return False, f"File not found: {str(e)}"
+    except ClientError as e:
+        # head_object has no body, so a missing key surfaces as a bare 404
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+            return False, f"File not found: {str(e)}"
+        return False, f"S3 validation error: {str(e)}"
     except Exception as e:
         return False, f"S3 validation error: {str(e)}"
 
@@ -105,6 +116,7 @@ def lambda_handler(event, context):
             'updated_at': timestamp
         }
         
+        # The job must exist before any worker can pick up its messages
         table.put_item(Item=job_item)
         
         # Queue message for rules transcript processing
@@ -113,21 +125,19 @@ def lambda_handler(event, context):
             'transcript_s3_url': body['transcript_s3_url']
         }
         
-        sqs.send_message(
-            QueueUrl=RULES_QUEUE_URL,
-            MessageBody=json.dumps(rules_message)
-        )
-        
         # Queue message for image processing of the video (sampling + llm image processing)
         image_message = {
             'job_id': job_id,
             'video_s3_url': body['video_s3_url']
         }
         
-        sqs.send_message(
-            QueueUrl=IMAGE_QUEUE_URL,
-            MessageBody=json.dumps(image_message)
-        )
+        # The queues are different, so the sends can't share a batch; overlap them instead
+        sends = [
+            executor.submit(sqs.send_message, QueueUrl=RULES_QUEUE_URL, MessageBody=json.dumps(rules_message)),
+            executor.submit(sqs.send_message, QueueUrl=IMAGE_QUEUE_URL, MessageBody=json.dumps(image_message))
+        ]
+        for send in sends:
+            send.result()
         
         # Return success
         return {
@@ -0,0 +1,65 @@
+"""
+Prebuild the moderation engine and upload it to ENGINE_CACHE_PATH.
+
+Run after updating the keywords CSV so that no cold start has to parse the CSV
+and build the automaton itself. ENGINE_CACHE_HMAC_KEY must hold the same secret
+as the Lambda's, which only unpickles engines carrying a matching signature:
+
+    ENGINE_CACHE_HMAC_KEY=... python build_engine_cache.py s3://bucket/keywords.csv s3://bucket/engine.pickle
+"""
+
+import argparse
+import os
+import pickle
+
+import boto3
+from transcript_moderation_optimized import ENGINE_CACHE_VERSION, ModerationEngine, engine_cache_signature
+
+
+def parse_s3_url(s3_url):
+    if not s3_url.startswith("s3://"):
+        raise ValueError(f"Invalid S3 URL format: {s3_url}")
+
+    bucket, _, key = s3_url[5:].partition("/")
+    if not bucket or not key:
+        raise ValueError(f"Invalid S3 URL format: {s3_url}")
+
+    return bucket, key
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prebuild the moderation engine cache")
+    parser.add_argument("keywords_path", help="S3 URL of the keywords CSV (BAD_KEYWORDS_PATH)")
+    parser.add_argument("engine_cache_path", help="S3 URL to upload to (ENGINE_CACHE_PATH)")
+    args = parser.parse_args()
+
+    hmac_key = os.environ.get("ENGINE_CACHE_HMAC_KEY")
+    if not hmac_key:
+        parser.error("ENGINE_CACHE_HMAC_KEY environment variable must be set")
+
+    s3 = boto3.client("s3")
+    keywords_bucket, keywords_key = parse_s3_url(args.keywords_path)
+    cache_bucket, cache_key = parse_s3_url(args.engine_cache_path)
+
+    response = s3.get_object(Bucket=keywords_bucket, Key=keywords_key)
+    engine = ModerationEngine.from_csv_bytes(response["Body"].read())
+    body = pickle.dumps(engine, protocol=pickle.HIGHEST_PROTOCOL)
+    etag = response["ETag"]
+
+    # The Lambda only loads the cache when these match the CSV's current ETag, its own
+    # code version and the signature it computes over the body with its copy of the key
+    s3.put_object(
+        Bucket=cache_bucket,
+        Key=cache_key,
+        Body=body,
+        Metadata={
+            "source-etag": etag,
+            "engine-version": ENGINE_CACHE_VERSION,
+            "engine-hmac": engine_cache_signature(hmac_key.encode("utf-8"), etag, body),
+        },
+    )
+    print(f"Uploaded engine built from {args.keywords_path} to {args.engine_cache_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,22 @@
+import hmac
 import json
 import boto3
 import os
-import tempfile
+import pickle
 import time
-from datetime import datetime
-from transcript_moderation_optimized import ModerationEngine, TranscriptParser
+from collections import defaultdict
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from transcript_moderation_optimized import (
+    ENGINE_CACHE_VERSION,
+    SEVERITY_SCORES,
+    KeywordMatcher,
+    ModerationEngine,
+    TranscriptParser,
+    dumps_results,
+    engine_cache_signature,
+    highest_severity_level,
+)
 
 # Initialize AWS clients
 s3 = boto3.client("s3")
@@ -17,6 +29,12 @@ DYNAMO_TABLE_NAME = os.environ.get("DYNAMO_TABLE_NAME")
 OUTPUT_BUCKET = os.environ.get("OUTPUT_BUCKET")
 RULES_QUEUE_URL = os.environ.get("RULES_QUEUE_URL")
 TEXT_LLM_QUEUE_URL = os.environ.get("TEXT_LLM_QUEUE_URL")
+# Optional s3:// location of a pickled engine prebuilt by build_engine_cache.py
+ENGINE_CACHE_PATH = os.environ.get("ENGINE_CACHE_PATH")
+# Secret the builder signs the engine with; the cache is only unpickled if its signature matches
+ENGINE_CACHE_HMAC_KEY = os.environ.get("ENGINE_CACHE_HMAC_KEY")
+
+table = dynamodb.Table(DYNAMO_TABLE_NAME) if DYNAMO_TABLE_NAME else None
 
 
 def parse_s3_url(s3_url):
@@ -32,6 +50,90 @@ def parse_s3_url(s3_url):
     return parts[0], parts[1]
 
 
+# Moderation engine cached across warm invocations, keyed by the keywords CSV ETag
+_engine = None
+_engine_etag = None
+
+
+def load_cached_engine(keywords_etag):
+    """Return the prebuilt engine from ENGINE_CACHE_PATH if it is signed and built from this CSV version."""
+    cache_bucket, cache_key = parse_s3_url(ENGINE_CACHE_PATH)
+    try:
+        response = s3.get_object(Bucket=cache_bucket, Key=cache_key)
+        metadata = response.get("Metadata", {})
+        if metadata.get("source-etag") != keywords_etag:
+            response["Body"].close()
+            print("Cached engine is stale, rebuilding from keywords CSV")
+            return None
+        if metadata.get("engine-version") != ENGINE_CACHE_VERSION:
+            response["Body"].close()
+            print("Cached engine was built by a different code version, rebuilding from keywords CSV")
+            return None
+
+        body = response["Body"].read()
+        # Unpickling runs code, so the body must be verified before it is loaded
+        expected = engine_cache_signature(ENGINE_CACHE_HMAC_KEY.encode("utf-8"), keywords_etag, body)
+        if not hmac.compare_digest(metadata.get("engine-hmac", ""), expected):
+            print("Cached engine signature does not match, rebuilding from keywords CSV")
+            return None
+
+        engine = pickle.loads(body)
+        # Signed by the builder, but still reject anything this code can't use
+        matcher = getattr(engine, "matcher", None)
+        if not (
+            isinstance(engine, ModerationEngine)
+            and isinstance(matcher, KeywordMatcher)
+            and hasattr(matcher, "automaton")
+            and hasattr(matcher, "patterns")
+        ):
+            print("Cached engine has an unexpected layout, rebuilding from keywords CSV")
+            return None
+        return engine
+    except Exception as e:
+        # A missing or unreadable cache only costs a rebuild from the CSV
+        print(f"Failed to load cached moderation engine: {e}")
+        return None
+
+
+def get_engine(keywords_bucket, keywords_key):
+    """Return the cached engine, rebuilding it only when the keywords CSV has changed."""
+    global _engine, _engine_etag
+
+    params = {"Bucket": keywords_bucket, "Key": keywords_key}
+    if _engine is not None:
+        params["IfNoneMatch"] = _engine_etag
+
+    try:
+        response = s3.get_object(**params)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("304", "NotModified"):
+            print("Keywords unchanged, reusing cached moderation engine")
+            return _engine
+        raise
+
+    etag = response["ETag"]
+    engine = load_cached_engine(etag) if ENGINE_CACHE_PATH and ENGINE_CACHE_HMAC_KEY else None
+    if engine is not None:
+        response["Body"].close()
+        print("Loaded prebuilt moderation engine from cache")
+    else:
+        # The CSV is small, so parse it straight from memory instead of via /tmp
+        engine = ModerationEngine.from_csv_bytes(response["Body"].read())
+
+    _engine = engine
+    _engine_etag = etag
+    return _engine
+
+
+# Build the engine during the INIT phase so the first invocation doesn't pay for it
+if BAD_KEYWORDS_PATH:
+    try:
+        get_engine(*parse_s3_url(BAD_KEYWORDS_PATH))
+    except Exception as e:
+        # The handler retries the load and reports the failure on the job
+        print(f"Failed to preload moderation engine: {e}")
+
+
 def lambda_handler(event, context):
     """
 
@@ -71,220 +173,174 @@ def lambda_handler(event, context):
         keywords_bucket, keywords_key = parse_s3_url(BAD_KEYWORDS_PATH)
 
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            download_start = time.time()
-            transcript_path = os.path.join(temp_dir, "transcript.vtt")
-            print(f"Downloading transcript from {transcript_s3_url}")
-            s3.download_file(input_bucket, transcript_key, transcript_path)
-            print(
-                f"Transcript downloaded in {time.time() - download_start:.2f} seconds"
+        engine_start = time.time()
+        print(f"Loading keywords from {BAD_KEYWORDS_PATH}")
+        engine = get_engine(keywords_bucket, keywords_key)
+        print(f"Keywords loaded in {time.time() - engine_start:.2f} seconds")
+
+        # Stream the transcript and parse it cue by cue instead of
+        # downloading, reading and splitting the whole file
+        parse_start = time.time()
+        print(f"Streaming transcript from {transcript_s3_url}")
+        response = s3.get_object(Bucket=input_bucket, Key=transcript_key)
+        lines = (line.decode("utf-8") for line in response["Body"].iter_lines())
+        utterances = list(TranscriptParser.parse_vtt_stream(lines))
+        print(
+            f"Parsed {len(utterances)} utterances in {time.time() - parse_start:.2f} seconds"
+        )
+
+        violations = []
+        moderation_start = time.time()
+        print(f"Starting moderation of {len(utterances)} utterances...")
+
+        # All utterances are scanned in one automaton pass
+        found_violations = engine.matcher.find_violations_batched(
+            [utterance.text for utterance in utterances]
+        )
+        for utterance_index, violation_data in found_violations:
+            utterance = utterances[utterance_index]
+            violations.append(
+                {
+                    "keyword": violation_data["keyword"],
+                    "speaker": utterance.speaker,
+                    "text": utterance.text,
+                    "timestamp": utterance.start_time,
+                    "categories": violation_data["categories"],
+                    "severity": violation_data["severity"],
+                }
             )
 
-            keywords_start = time.time()
-            keywords_path = os.path.join(temp_dir, "keywords.csv")
-            print(f"Downloading keywords from {BAD_KEYWORDS_PATH}")
-            s3.download_file(keywords_bucket, keywords_key, keywords_path)
-            print(f"Keywords downloaded in {time.time() - keywords_start:.2f} seconds")
-
-            engine_start = time.time()
-            print("Loading keywords into moderation engine...")
-            engine = ModerationEngine(keywords_path)
-            print(f"Keywords loaded in {time.time() - engine_start:.2f} seconds")
-
-            parse_start = time.time()
-            print("Reading transcript file...")
-            with open(transcript_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            print(f"Transcript read in {time.time() - parse_start:.2f} seconds")
-
-            parse_vtt_start = time.time()
-            print("Parsing VTT content...")
-            utterances = TranscriptParser.parse_vtt(content)
-            print(
-                f"Parsed {len(utterances)} utterances in {time.time() - parse_vtt_start:.2f} seconds"
-            )
-
-            violations = []
-            moderation_start = time.time()
-            print(f"Starting moderation of {len(utterances)} utterances...")
-            processed_count = 0
-            last_log_time = time.time()
-
-            for i, utterance in enumerate(utterances):
-                found_violations = engine.matcher.find_violations(utterance.text)
-                for violation_data in found_violations:
-                    violations.append(
-                        {
-                            "keyword": violation_data["keyword"],
-                            "speaker": utterance.speaker,
-                            "text": utterance.text,
-                            "timestamp": utterance.start_time,
-                            "categories": violation_data["categories"],
-                            "severity": violation_data["severity"],
-                        }
-                    )
-
-                processed_count += 1
-
-                if time.time() - last_log_time > 10:
-                    elapsed = time.time() - moderation_start
-                    rate = processed_count / elapsed
-                    remaining = (
-                        (len(utterances) - processed_count) / rate if rate > 0 else 0
-                    )
-                    print(
-                        f"Progress: {processed_count}/{len(utterances)} utterances processed "
-                        f"({processed_count * 100 / len(utterances):.1f}%) - "
-                        f"Rate: {rate:.1f} utterances/sec - "
-                        f"Est. remaining: {remaining:.1f} seconds"
-                    )
-                    last_log_time = time.time()
-
-            print(
-                f"Moderation completed in {time.time() - moderation_start:.2f} seconds"
-            )
-            print(f"Found {len(violations)} total violations")
-
-            # Calculate severity scores
-            analysis_start = time.time()
-            print("Analyzing violations and creating report...")
-            severity_scores = {"LOW": 1, "MEDIUM": 5, "HIGH": 10}
-            compound_score = sum(
-                severity_scores.get(v["severity"], 1) for v in violations
-            )
-
-            # Find highest severity
-            if violations:
-                severity_order = ["HIGH", "MEDIUM", "LOW"]
-                highest_severity = next(
-                    (
-                        sev
-                        for sev in severity_order
-                        if any(v["severity"] == sev for v in violations)
-                    ),
-                    "LOW",
-                )
-            else:
-                highest_severity = None
-
-            # Create category-based report
-            category_report = {}
-            for violation in violations:
-                for category in violation["categories"]:
-                    if category not in category_report:
-                        category_report[category] = {
-                            "count": 0,
-                            "violations": [],
-                            "speakers": set(),
-                        }
-                    category_report[category]["count"] += 1
-                    category_report[category]["violations"].append(
-                        {
-                            "keyword": violation["keyword"],
-                            "speaker": violation["speaker"],
-                            "timestamp": violation["timestamp"],
-                            "severity": violation["severity"],
-                        }
-                    )
-                    category_report[category]["speakers"].add(violation["speaker"])
-
-            for category in category_report:
-                category_report[category]["speakers"] = list(
-                    category_report[category]["speakers"]
-                )
-
-            # Prepare results
-            results = {
-                "job_id": job_id,
-                "transcript_file": transcript_key,
-                "transcript_s3_url": transcript_s3_url,
-                "processed_at": datetime.utcnow().isoformat(),
-                "total_utterances": len(utterances),
-                "total_violations": len(violations),
-                "compound_severity_score": compound_score,
-                "highest_severity_level": highest_severity,
-                "violations": violations,
-                "speakers_with_violations": list(set(v["speaker"] for v in violations)),
-                "category_report": category_report,
+        print(
+            f"Moderation completed in {time.time() - moderation_start:.2f} seconds"
+        )
+        print(f"Found {len(violations)} total violations")
+
+        # Score, severity, speakers and category report in a single pass
+        analysis_start = time.time()
+        print("Analyzing violations and creating report...")
+        compound_score = 0
+        seen_severities = set()
+        speakers_with_violations = set()
+        category_report = defaultdict(
+            lambda: {"count": 0, "violations": [], "speakers": set()}
+        )
+        for violation in violations:
+            severity = violation["severity"]
+            speaker = violation["speaker"]
+            compound_score += SEVERITY_SCORES.get(severity, 1)
+            seen_severities.add(severity)
+            speakers_with_violations.add(speaker)
+
+            entry = {
+                "keyword": violation["keyword"],
+                "speaker": speaker,
+                "timestamp": violation["timestamp"],
+                "severity": severity,
             }
-
-            print(
-                f"Report analysis completed in {time.time() - analysis_start:.2f} seconds"
-            )
-
-            # Generate output filename with job_id
-            timestamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
-            output_key = f"moderation-results/{job_id}/rules_result.json"
-
-            # Upload results to S3
-            upload_start = time.time()
-            output_location = f"s3://{OUTPUT_BUCKET}/{output_key}"
-            print(f"Uploading results to {output_location}")
-            s3.put_object(
-                Bucket=OUTPUT_BUCKET,
-                Key=output_key,
-                Body=json.dumps(results, indent=2, ensure_ascii=False),
-                ContentType="application/json",
+            for category in violation["categories"]:
+                report = category_report[category]
+                report["count"] += 1
+                report["violations"].append(entry)
+                report["speakers"].add(speaker)
+
+        highest_severity = highest_severity_level(seen_severities)
+
+        category_report = {
+            category: {**report, "speakers": list(report["speakers"])}
+            for category, report in category_report.items()
+        }
+
+        # Prepare results
+        processed_at = datetime.now(timezone.utc).isoformat()
+        results = {
+            "job_id": job_id,
+            "transcript_file": transcript_key,
+            "transcript_s3_url": transcript_s3_url,
+            "processed_at": processed_at,
+            "total_utterances": len(utterances),
+            "total_violations": len(violations),
+            "compound_severity_score": compound_score,
+            "highest_severity_level": highest_severity,
+            "violations": violations,
+            "speakers_with_violations": list(speakers_with_violations),
+            "category_report": category_report,
+        }
+
+        print(
+            f"Report analysis completed in {time.time() - analysis_start:.2f} seconds"
+        )
+
+        # Generate output filename with job_id
+        output_key = f"moderation-results/{job_id}/rules_result.json"
+
+        # Upload results to S3
+        upload_start = time.time()
+        output_location = f"s3://{OUTPUT_BUCKET}/{output_key}"
+        print(f"Uploading results to {output_location}")
+        s3.put_object(
+            Bucket=OUTPUT_BUCKET,
+            Key=output_key,
+            Body=dumps_results(results),
+            ContentType="application/json",
+        )
+        print(f"Upload completed in {time.time() - upload_start:.2f} seconds")
+
+        # Update DynamoDB with completion status
+        if table is not None:
+            table.update_item(
+                Key={"job_id": job_id},
+                UpdateExpression="set transcript_rules_result_s3_url=:o, updated_at=:u",
+                ExpressionAttributeValues={
+                    ":o": output_location,
+                    ":u": processed_at,
+                },
             )
-            print(f"Upload completed in {time.time() - upload_start:.2f} seconds")
 
-            # Update DynamoDB with completion status
-            if DYNAMO_TABLE_NAME:
-                table = dynamodb.Table(DYNAMO_TABLE_NAME)
-                table.update_item(
-                    Key={"job_id": job_id},
-                    UpdateExpression="set transcript_rules_result_s3_url=:o, updated_at=:u",
-                    ExpressionAttributeValues={
-                        ":o": output_location,
-                        ":u": datetime.utcnow().isoformat(),
-                    },
-                )
-
-            # Send to TEXT_LLM_QUEUE
-            if TEXT_LLM_QUEUE_URL:
-                print(f"Sending violations to LLM queue for further processing...")
-                sqs.send_message(
-                    QueueUrl=TEXT_LLM_QUEUE_URL,
-                    MessageBody=json.dumps(
-                        {
-                            "job_id": job_id,
-                            "transcript_s3_url": transcript_s3_url,
-                        }
-                    ),
-                )
-                print("Message sent to LLM queue")
-
-            # Log summary
-            total_time = time.time() - start_time
-            print(f"\nProcessing completed successfully:")
-            print(f"  - Job ID: {job_id}")
-            print(f"  - Total time: {total_time:.2f} seconds")
-            print(f"  - Utterances: {len(utterances)}")
-            print(f"  - Violations: {len(violations)}")
-            print(f"  - Output: {output_location}")
-
-            # Return success response
-            return {
-                "statusCode": 200,
-                "body": json.dumps(
+        # Send to TEXT_LLM_QUEUE
+        if TEXT_LLM_QUEUE_URL:
+            print(f"Sending violations to LLM queue for further processing...")
+            sqs.send_message(
+                QueueUrl=TEXT_LLM_QUEUE_URL,
+                MessageBody=json.dumps(
                     {
-                        "message": "Moderation completed successfully",
                         "job_id": job_id,
-                        "output_location": output_location,
-                        "total_violations": len(violations),
-                        "highest_severity": highest_severity,
+                        "transcript_s3_url": transcript_s3_url,
                     }
                 ),
-            }
+            )
+            print("Message sent to LLM queue")
+
+        # Log summary
+        total_time = time.time() - start_time
+        print(f"\nProcessing completed successfully:")
+        print(f"  - Job ID: {job_id}")
+        print(f"  - Total time: {total_time:.2f} seconds")
+        print(f"  - Utterances: {len(utterances)}")
+        print(f"  - Violations: {len(violations)}")
+        print(f"  - Output: {output_location}")
+
+        # Return success response
+        return {
+            "statusCode": 200,
+            "body": json.dumps(
+                {
+                    "message": "Moderation completed successfully",
+                    "job_id": job_id,
+                    "output_location": output_location,
+                    "total_violations": len(violations),
+                    "highest_severity": highest_severity,
+                }
+            ),
+        }
 
     except Exception as e:
         error_msg = f"Error processing job {job_id if 'job_id' in locals() else 'unknown'}: {str(e)}"
         print(error_msg)
 
         # Update DynamoDB with error status if possible
-        if DYNAMO_TABLE_NAME and "job_id" in locals():
+        if table is not None and "job_id" in locals():
             try:
-                table = dynamodb.Table(DYNAMO_TABLE_NAME)
+                failed_at = datetime.now(timezone.utc).isoformat()
                 table.update_item(
                     Key={"job_id": job_id},
                     UpdateExpression="SET #status = :status, error_message = :error, failed_at = :failed, updated_at = :updated",
@@ -292,8 +348,8 @@ def lambda_handler(event, context):
                     ExpressionAttributeValues={
                         ":status": "FAILED",
                         ":error": str(e),
-                        ":failed": datetime.utcnow().isoformat(),
-                        ":updated": datetime.utcnow().isoformat(),
+                        ":failed": failed_at,
+                        ":updated": failed_at,
                     },
 
                 )
@@ -1,9 +1,45 @@
+import ast
 import csv
+import hashlib
+import hmac
+import io
 import re
+import string
 import json
+import os
 import ahocorasick
-from dataclasses import dataclass, asdict
-from typing import List, Dict
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+SEVERITY_SCORES = {"LOW": 1, "MEDIUM": 5, "HIGH": 10}
+SEVERITY_RANKS = {"LOW": 1, "MEDIUM": 2, "HIGH": 3}
+# Indexed by rank; rank 0 means no violations at all
+SEVERITY_LEVELS = (None, "LOW", "MEDIUM", "HIGH")
+# Version of the pickled engine layout; bump it whenever KeywordMatcher or
+# ModerationEngine attributes change so engine caches built by older code are rebuilt
+ENGINE_CACHE_VERSION = "2"
+# Characters that continue a word, so a single-word match next to one is rejected
+WORD_CHARS = frozenset(string.ascii_letters + string.digits + "-")
+
+
+def dumps_results(results: Dict) -> bytes:
+    """Serialize a results report to indented UTF-8 JSON bytes."""
+    return json.dumps(results, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def engine_cache_signature(key: bytes, source_etag: str, body: bytes) -> str:
+    """HMAC-SHA256 of a pickled engine, bound to the CSV ETag and code version it was built for."""
+    mac = hmac.new(key, f"{ENGINE_CACHE_VERSION}\n{source_etag}\n".encode("utf-8"), hashlib.sha256)
+    mac.update(body)
+    return mac.hexdigest()
+
+
+def highest_severity_level(severities: Iterable[str]) -> Optional[str]:
+    """Return the most severe level in one pass; unknown levels count as LOW."""
+    rank = max((SEVERITY_RANKS.get(s, 1) for s in severities), default=0)
+    return SEVERITY_LEVELS[rank]
 
 
 @dataclass
@@ -29,8 +65,11 @@ class KeywordMatcher:
         self.single_words = {}
         self.phrases = {}
 
-        # Initialize Aho-Corasick automaton for all keywords
-        self.automaton = ahocorasick.Automaton()
+        # Initialize Aho-Corasick automaton for all keywords. It stores only an int
+        # pattern id per node; the parallel patterns list holds each keyword's
+        # length, whether it needs a word-boundary check, and its prebuilt violation
+        self.automaton = ahocorasick.Automaton(ahocorasick.STORE_INTS)
+        self.patterns: List[Tuple[int, bool, Dict]] = []
 
         for item in keyword_data:
             keyword = item.get("keyword", "")
@@ -45,216 +84,310 @@ class KeywordMatcher:
                 if " " in normalized:
                     self.phrases[normalized] = data
                     # Add phrase to automaton
-                    self.automaton.add_word(normalized, (normalized, data, "phrase"))
+                    match_type = "phrase"
                 else:
                     self.single_words[normalized] = data
                     # For single words, we'll use Aho-Corasick with boundary checking
-                    self.automaton.add_word(normalized, (normalized, data, "word"))
+                    match_type = "word"
+                # A repeated keyword re-points its node at the newest entry
+                self.automaton.add_word(normalized, len(self.patterns))
+                violation = {
+                    "keyword": normalized,
+                    "categories": data["categories"],
+                    "severity": data["severity"],
+                }
+                self.patterns.append((len(normalized), match_type == "word", violation))
 
         # Build the automaton
         self.automaton.make_automaton()
 
-        # Pre-compile regex for word boundary checking
-        self.word_boundary_pattern = re.compile(r"[a-zA-Z0-9-]")
-
         print(
             f"KeywordMatcher initialized with {len(self.single_words)} single words and {len(self.phrases)} phrases"
         )
         print(f"Aho-Corasick automaton built with {len(self.automaton)} patterns")
 
-    def _check_word_boundary(self, text: str, start: int, end: int) -> bool:
-        """Check if the match at position has proper word boundaries."""
-        # Check left boundary
-        if start > 0 and self.word_boundary_pattern.match(text[start - 1]):
-            return False
-
-        # Check right boundary
-        if end < len(text) and self.word_boundary_pattern.match(text[end]):
-            return False
-
-        return True
-
     def find_violations(self, text: str) -> List[Dict]:
+        return [violation for _, violation in self.find_violations_batched([text])]
+
+    def find_violations_batched(self, texts: List[str]) -> List[Tuple[int, Dict]]:
+        """Find violations in many texts with a single automaton pass.
+
+        Texts are joined with a newline, which no keyword contains and which counts
+        as a word boundary, so matches never span two texts. Each match is mapped
+        back to the index of its text.
+
+        Repeated texts (intros, "[music]" markers) are scanned only once and their
+        matches reported for every occurrence.
+
+        Returns:
+            (text_index, violation) pairs, in text order. Violation dicts are shared
+            between matches of the same keyword and must not be mutated.
+        """
+        unique_index = {}
+        text_ids = [unique_index.setdefault(text, len(unique_index)) for text in texts]
+        if len(unique_index) == len(texts):
+            return self._scan(texts)
+
+        matches_by_unique = [[] for _ in unique_index]
+        for unique_id, violation in self._scan(list(unique_index)):
+            matches_by_unique[unique_id].append(violation)
+        return [
+            (text_index, violation)
+            for text_index, unique_id in enumerate(text_ids)
+            for violation in matches_by_unique[unique_id]
+        ]
+
+    def _scan(self, texts: List[str]) -> List[Tuple[int, Dict]]:
+        """Run the joined automaton pass over texts; see find_violations_batched."""
         violations = []
-        seen_violations = set()  # Track (keyword, position) to avoid duplicates
 
-        # Normalize text
-        text_normalized = text.lower().replace("\u2011", "-")
+        # Normalize the joined text in one lower() and one replace() pass. The
+        # newline separator is uncased, so this matches normalizing each text
+        raw_text = "\n".join(texts)
+        joined_text = raw_text.lower().replace("\u2011", "-")
+        if len(joined_text) == len(raw_text):
+            text_lengths = [len(text) for text in texts]
+        else:
+            # lower() changed some lengths (e.g. "İ"), so offsets need the normalized texts
+            normalized_texts = [text.lower().replace("\u2011", "-") for text in texts]
+            text_lengths = [len(text) for text in normalized_texts]
+            joined_text = "\n".join(normalized_texts)
+        text_offsets = []
+        offset = 0
+        for length in text_lengths:
+            text_offsets.append(offset)
+            offset += length + 1
+        text_length = len(joined_text)
 
         # Use Aho-Corasick to find all matches
-        for end_pos, (keyword, data, match_type) in self.automaton.iter(
-            text_normalized
-        ):
-            start_pos = end_pos - len(keyword) + 1
-
-            # For single words, verify word boundaries
-            if match_type == "word":
-                if not self._check_word_boundary(
-                    text_normalized, start_pos, end_pos + 1
-                ):
+        patterns = self.patterns
+        # Each keyword is one automaton entry and is reported at most once per end
+        # position, so no (keyword, position) can repeat and no dedup set is needed
+        for end_pos, pattern_id in self.automaton.iter(joined_text):
+            keyword_length, is_word, violation = patterns[pattern_id]
+            start_pos = end_pos - keyword_length + 1
+
+            # For single words, verify word boundaries with a set lookup per side
+            if is_word:
+                if start_pos > 0 and joined_text[start_pos - 1] in WORD_CHARS:
+                    continue
+                if end_pos + 1 < text_length and joined_text[end_pos + 1] in WORD_CHARS:
                     continue
 
-            # Avoid duplicate violations at the same position
-            violation_key = (keyword, start_pos)
-            if violation_key not in seen_violations:
-                seen_violations.add(violation_key)
-                violations.append(
-                    {
-                        "keyword": keyword,
-                        "categories": data["categories"],
-                        "severity": data["severity"],
-                    }
-                )
+            violations.append((bisect_right(text_offsets, start_pos) - 1, violation))
 
         return violations
 
 
 class TranscriptParser:
+    TIMESTAMP_PATTERN = re.compile(
+        r"(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})"
+    )
+
     @staticmethod
     def parse_vtt(content: str) -> List[Utterance]:
-        utterances = []
-        blocks = content.strip().split("\n\n")
+        # Split on "\n" only, as iter_lines does; str.splitlines would also break on
+        # \u2028, form feeds and other separators inside a cue's text
+        return list(
+            TranscriptParser.parse_vtt_stream(line.rstrip("\r") for line in content.split("\n"))
+        )
 
-        for block in blocks:
-            lines = block.strip().split("\n")
-            if len(lines) < 3 or "WEBVTT" in lines[0]:
-                continue
+    @staticmethod
+    def parse_vtt_stream(lines: Iterable[str]) -> Iterator[Utterance]:
+        """Parse VTT cues from an iterable of lines, one cue at a time.
+
+        Lines are expected without line endings (as from StreamingBody.iter_lines).
+        Blank lines end a cue, which gives the same blocks as parse_vtt while only
+        holding the current cue in memory.
+        """
+        block_lines = []
+        for line in lines:
+            if line:
+                block_lines.append(line)
+            elif block_lines:
+                yield from TranscriptParser._parse_block("\n".join(block_lines))
+                block_lines = []
+        if block_lines:
+            yield from TranscriptParser._parse_block("\n".join(block_lines))
 
-            # Parse timestamp line
-            timestamp_match = re.search(
-                r"(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})", block
-            )
-            if not timestamp_match:
-                continue
+    @staticmethod
+    def _parse_block(block: str) -> List[Utterance]:
+        utterances = []
+        lines = block.strip().split("\n")
+        if len(lines) < 3 or "WEBVTT" in lines[0]:
+            return utterances
 
-            start_time = timestamp_match.group(1)
-            end_time = timestamp_match.group(2)
+        # Parse timestamp line
+        timestamp_match = TranscriptParser.TIMESTAMP_PATTERN.search(block)
+        if not timestamp_match:
+            return utterances
 
-            # Parse speaker and text
-            for line in lines[2:]:
-                if ":" in line:
-                    parts = line.split(":", 1)
-                    speaker = parts[0].strip()
-                    text = parts[1].strip() if len(parts) > 1 else ""
+        start_time = timestamp_match.group(1)
+        end_time = timestamp_match.group(2)
 
-                    if text:
-                        utterances.append(
-                            Utterance(speaker, text, start_time, end_time)
-                        )
+        # Parse speaker and text
+        for line in lines[2:]:
+            if ":" in line:
+                parts = line.split(":", 1)
+                speaker = parts[0].strip()
+                text = parts[1].strip() if len(parts) > 1 else ""
+
+                if text:
+                    utterances.append(Utterance(speaker, text, start_time, end_time))
 
         return utterances
 
 
 class ModerationEngine:
-    def __init__(self, keywords_path: str):
-        self.matcher = KeywordMatcher(self._load_keywords(keywords_path))
-
-    def _load_keywords(self, csv_path: str) -> List[Dict]:
-        keyword_data = []
+    def __init__(self, keywords_path: str = None, keyword_data: List[Dict] = None):
+        if keyword_data is None:
+            keyword_data = self._load_keywords(keywords_path)
+        self.matcher = KeywordMatcher(keyword_data)
+
+    @classmethod
+    def from_csv_bytes(cls, data: bytes) -> "ModerationEngine":
+        """Build the engine from keyword CSV content already held in memory."""
+        return cls(keyword_data=cls._parse_keywords(io.StringIO(data.decode("utf-8"))))
+
+    @classmethod
+    def _load_keywords(cls, csv_path: str) -> List[Dict]:
         print(f"Loading keywords from {csv_path}...")
         with open(csv_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if "cleaned_words" in row and row["cleaned_words"]:
-                    # Parse categories from string representation of list
-                    categories_str = row.get("mod_categories", "[]")
-                    try:
-                        # Handle string representation of list
-                        import ast
-
-                        categories = (
-                            ast.literal_eval(categories_str) if categories_str else []
-                        )
-                    except (ValueError, SyntaxError):
-                        categories = []
-
-                    keyword_data.append(
-                        {
-                            "keyword": row["cleaned_words"],
-                            "categories": categories,
-                            "severity": row.get("mod_critical", "LOW"),
-                        }
-                    )
+            return cls._parse_keywords(f)
+
+    @staticmethod
+    def _parse_keywords(lines: Iterable[str]) -> List[Dict]:
+        keyword_data = []
+        reader = csv.DictReader(lines)
+        for row in reader:
+            if "cleaned_words" in row and row["cleaned_words"]:
+                keyword_data.append(
+                    {
+                        "keyword": row["cleaned_words"],
+                        "categories": ModerationEngine._parse_categories(
+                            row.get("mod_categories", "[]")
+                        ),
+                        "severity": row.get("mod_critical", "LOW"),
+                    }
+                )
         print(f"Loaded {len(keyword_data)} keywords from CSV")
         return keyword_data
 
+    @staticmethod
+    def _parse_categories(categories_str: str) -> List[str]:
+        """Parse the string representation of a list, e.g. "['Violence', 'Drugs']"."""
+        if not categories_str:
+            return []
+        # With no escapes or double quotes, swapping quotes gives equivalent JSON,
+        # which parses without building a Python AST
+        if "\\" not in categories_str and '"' not in categories_str:
+            try:
+                categories = json.loads(categories_str.replace("'", '"'))
+            except json.JSONDecodeError:
+                pass
+            else:
+                # JSON also accepts null, true, NaN and Infinity, which literal_eval rejects
+                if isinstance(categories, list) and all(isinstance(c, str) for c in categories):
+                    return categories
+        # Anything else still needs the full literal parser
+        try:
+            return ast.literal_eval(categories_str)
+        except (ValueError, SyntaxError):
+            return []
+
     def process_transcript(self, vtt_path: str) -> Dict:
         with open(vtt_path, "r", encoding="utf-8") as f:
-            content = f.read()
-
-        utterances = TranscriptParser.parse_vtt(content)
+            utterances = list(
+                TranscriptParser.parse_vtt_stream(line.rstrip("\r\n") for line in f)
+            )
         violations = []
 
-        for utterance in utterances:
-            found_violations = self.matcher.find_violations(utterance.text)
-            for violation_data in found_violations:
-                violations.append(
-                    Violation(
-                        keyword=violation_data["keyword"],
-                        speaker=utterance.speaker,
-                        text=utterance.text,
-                        timestamp=utterance.start_time,
-                        categories=violation_data["categories"],
-                        severity=violation_data["severity"],
-                    )
+        # All utterances are scanned in one automaton pass
+        found_violations = self.matcher.find_violations_batched(
+            [utterance.text for utterance in utterances]
+        )
+        for utterance_index, violation_data in found_violations:
+            utterance = utterances[utterance_index]
+            violations.append(
+                Violation(
+                    keyword=violation_data["keyword"],
+                    speaker=utterance.speaker,
+                    text=utterance.text,
+                    timestamp=utterance.start_time,
+                    categories=violation_data["categories"],
+                    severity=violation_data["severity"],
                 )
-
-        # Calculate severity scores
-        severity_scores = {"LOW": 1, "MEDIUM": 5, "HIGH": 10}
-        compound_score = sum(severity_scores.get(v.severity, 1) for v in violations)
-
-        # Find highest severity
-        if violations:
-            severity_order = ["HIGH", "MEDIUM", "LOW"]
-            highest_severity = next(
-                (
-                    sev
-                    for sev in severity_order
-                    if any(v.severity == sev for v in violations)
-                ),
-                "LOW",
             )
-        else:
-            highest_severity = None
 
-        # Create category-based report
-        category_report = {}
+        # Score, severity, speakers, flags and category report in a single pass
+        compound_score = 0
+        seen_severities = set()
+        speakers_with_flags = set()
+        flags = []
+        category_report = defaultdict(
+            lambda: {"count": 0, "flags": [], "speakers": set()}
+        )
         for violation in violations:
+            severity = violation.severity
+            speaker = violation.speaker
+            compound_score += SEVERITY_SCORES.get(severity, 1)
+            seen_severities.add(severity)
+            speakers_with_flags.add(speaker)
+            # Same keys as asdict(), without its recursive deep copy
+            flags.append(
+                {
+                    "keyword": violation.keyword,
+                    "speaker": speaker,
+                    "text": violation.text,
+                    "timestamp": violation.timestamp,
+                    "categories": list(violation.categories),
+                    "severity": severity,
+                }
+            )
+
+            entry = {
+                "keyword": violation.keyword,
+                "speaker": speaker,
+                "timestamp": violation.timestamp,
+                "severity": severity,
+            }
             for category in violation.categories:
-                if category not in category_report:
-                    category_report[category] = {
-                        "count": 0,
-                        "flags": [],
-                        "speakers": set(),
-                    }
-                category_report[category]["count"] += 1
-                category_report[category]["flags"].append(
-                    {
-                        "keyword": violation.keyword,
-                        "speaker": violation.speaker,
-                        "timestamp": violation.timestamp,
-                        "severity": violation.severity,
-                    }
-                )
-                category_report[category]["speakers"].add(violation.speaker)
+                report = category_report[category]
+                report["count"] += 1
+                report["flags"].append(entry)
+                report["speakers"].add(speaker)
 
         # Convert sets to lists for JSON serialization
-        for category in category_report:
-            category_report[category]["speakers"] = list(
-                category_report[category]["speakers"]
-            )
+        category_report = {
+            category: {**report, "speakers": list(report["speakers"])}
+            for category, report in category_report.items()
+        }
 
         return {
             "total_utterances": len(utterances),
             "total_flags": len(violations),
             "compound_severity_score": compound_score,
-            "highest_severity_level": highest_severity,
-            "flags": [asdict(v) for v in violations],
-            "speakers_with_flags": list(set(v.speaker for v in violations)),
+            "highest_severity_level": highest_severity_level(seen_severities),
+            "flags": flags,
+            "speakers_with_flags": list(speakers_with_flags),
             "category_report": category_report,
         }
 
 
+# Engines built by moderate_transcript, keyed by keywords CSV path and mtime
+_engines: Dict[Tuple[str, float], ModerationEngine] = {}
+
+
+def get_engine(keywords_csv_path: str) -> ModerationEngine:
+    """Return an engine for the CSV, reusing it until the file is modified."""
+    key = (os.path.abspath(keywords_csv_path), os.path.getmtime(keywords_csv_path))
+    engine = _engines.get(key)
+    if engine is None:
+        _engines.clear()
+        engine = _engines[key] = ModerationEngine(keywords_csv_path)
+    return engine
+
+
 def moderate_transcript(
     transcript_path: str, keywords_csv_path: str, output_path: str = None
 ) -> Dict:
@@ -269,15 +402,15 @@ def moderate_transcript(
     Returns:
         Dictionary containing moderation results
     """
-    engine = ModerationEngine(keywords_csv_path)
+    engine = get_engine(keywords_csv_path)
     results = engine.process_transcript(transcript_path)
 
     # Save to JSON file
     if output_path is None:
         output_path = "transcript_moderation_results.json"
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    with open(output_path, "wb") as f:
+        f.write(dumps_results(results))
 
     print(f"Results saved to {output_path}")
 
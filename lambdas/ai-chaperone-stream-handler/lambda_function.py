@@ -1,17 +1,30 @@
+import gzip
 import json
 import boto3
 import urllib3
+import socket
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any
 from urllib.parse import urlparse
 
 
 s3 = boto3.client('s3')
 dynamodb = boto3.client('dynamodb')
-http = urllib3.PoolManager(timeout=urllib3.Timeout(connect=5.0, read=10.0))
+# Pooled keep-alive connections, so back-to-back webhooks and retries to one host reuse a socket
+http = urllib3.PoolManager(
+    maxsize=4,
+    timeout=urllib3.Timeout(connect=5.0, read=10.0),
+    socket_options=urllib3.connection.HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    ]
+)
 table_name = os.environ['DYNAMO_TABLE_NAME']
 
+# Kept across warm invocations; result files are fetched concurrently on it
+executor = ThreadPoolExecutor(max_workers=4)
+
 SEVERITY_LEVELS = {
     'SAFE': 0,
     'LOW': 1,
@@ -19,11 +32,13 @@ SEVERITY_LEVELS = {
     'HIGH': 3
 }
 
+# Reverse of SEVERITY_LEVELS, indexed by level value
+SEVERITY_LEVEL_NAMES = tuple(sorted(SEVERITY_LEVELS, key=SEVERITY_LEVELS.get))
+
 def get_severity_level_name(level_value: int) -> str:
     """Convert severity level value back to name"""
-    for name, value in SEVERITY_LEVELS.items():
-        if value == level_value:
-            return name
+    if 0 <= level_value < len(SEVERITY_LEVEL_NAMES):
+        return SEVERITY_LEVEL_NAMES[level_value]
     return 'SAFE'
 
 def parse_s3_url(s3_url: str) -> tuple:
@@ -47,7 +62,11 @@ def fetch_s3_file(s3_url: str) -> Optional[Dict[str, Any]]:
             return None
 
         response = s3.get_object(Bucket=bucket, Key=key)
-        content = response['Body'].read().decode('utf-8')
+        content = response['Body'].read()
+        # boto3 doesn't undo Content-Encoding, and large results are stored gzipped
+        if response.get('ContentEncoding') == 'gzip':
+            content = gzip.decompress(content)
+        content = content.decode('utf-8')
 
         # Parse JSON with error handling
         try:
@@ -94,13 +113,15 @@ def is_valid_url(url: str) -> bool:
 
 def call_webhook_with_retry(webhook_url: str, payload: dict, max_retries: int = 3) -> bool:
     """Call webhook with retry logic"""
+    # Encoded once; every attempt sends the same bytes
+    body = json.dumps(payload).encode('utf-8')
     for attempt in range(max_retries):
         try:
             print(f"Calling webhook (attempt {attempt + 1}/{max_retries})")
             response = http.request(
                 'POST',
                 webhook_url,
-                body=json.dumps(payload).encode('utf-8'),
+                body=body,
                 headers={'Content-Type': 'application/json'},
                 retries=False  # Handle retries ourselves
             )
@@ -122,124 +143,169 @@ def call_webhook_with_retry(webhook_url: str, payload: dict, max_retries: int =
 
     return False
 
+def combined_flag_update(job_id: str, timestamp: str) -> dict:
+    """Build the update that marks a job as combined and complete"""
+    return {
+        'TableName': table_name,
+        'Key': {'job_id': {'S': job_id}},
+        'UpdateExpression': 'SET combined = :val, updated_at = :timestamp, #st = :st',
+        'ExpressionAttributeNames': {
+            '#st': 'status'
+        },
+        'ExpressionAttributeValues': {
+            ':val': {'BOOL': True},
+            ':st': {'S': 'COMPLETE'},
+            ':timestamp': {'S': timestamp}
+        }
+    }
+
 def update_combined_flag(job_id: str) -> bool:
     """Update the combined flag in DynamoDB"""
     try:
-        dynamodb.update_item(
-            TableName=table_name,
-            Key={'job_id': {'S': job_id}},
-            UpdateExpression='SET combined = :val, updated_at = :timestamp, #st = :st',
-            ExpressionAttributeNames={
-                '#st': 'status'
-            },
-            ExpressionAttributeValues={
-                ':val': {'BOOL': True},
-                ':st': {'S': 'COMPLETE'},
-                ':timestamp': {'S': time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}
-            }
-        )
+        dynamodb.update_item(**combined_flag_update(job_id, time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')))
         print(f"Successfully updated combined flag for job {job_id}")
         return True
     except Exception as e:
         print(f"Error updating combined flag for job {job_id}: {str(e)}")
         return False
 
-def lambda_handler(event, context):
-    print(f"Processing {len(event['Records'])} stream records")
-
-    for record in event['Records']:
-        # Only process MODIFY events
-        if record['eventName'] != 'MODIFY':
-            print(f"Skipping {record['eventName']} event")
-            continue
-
-        old_image = record['dynamodb'].get('OldImage', {})
-        new_image = record['dynamodb'].get('NewImage', {})
-
-        # Check for required job_id field
-        if 'job_id' not in new_image or 'S' not in new_image['job_id']:
-            print("Error: Missing job_id in DynamoDB record, skipping")
-            continue
-
-        job_id = new_image['job_id']['S']
-
-        old_transcript = old_image.get('transcript_complete', {}).get('BOOL', False)
-        old_video = old_image.get('video_complete', {}).get('BOOL', False)
-
-        new_transcript = new_image.get('transcript_complete', {}).get('BOOL', False)
-        new_video = new_image.get('video_complete', {}).get('BOOL', False)
-        combined = new_image.get('combined', {}).get('BOOL', False)
-
-        # Check if this update just completed both branches
-        was_incomplete = not (old_transcript and old_video)
-        is_complete = new_transcript and new_video
-
-        # print all of the variables in this row
-        print(f"Processing job {job_id}, combined {combined}, webhook {new_image.get('webhook_url', {}).get('S', '')}, table_name {table_name}")
-
+def is_already_combined(job_id: str) -> bool:
+    """Check the live item, since a retried batch replays NewImages taken before the flag was set"""
+    try:
+        response = dynamodb.get_item(
+            TableName=table_name,
+            Key={'job_id': {'S': job_id}},
+            ProjectionExpression='combined',
+            ConsistentRead=True
+        )
+        return response.get('Item', {}).get('combined', {}).get('BOOL', False)
+    except Exception as e:
+        print(f"Error reading combined flag for job {job_id}, assuming not combined: {str(e)}")
+        return False
 
-        if was_incomplete and is_complete and not combined:
-            print(f"Job {job_id} ready for combination, processing...")
+def update_combined_flags(job_ids: list) -> None:
+    """Update the combined flag for many jobs, up to 100 per TransactWriteItems call"""
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    job_ids = list(dict.fromkeys(job_ids))  # A transaction can't touch the same item twice
+    for i in range(0, len(job_ids), 100):
+        batch = job_ids[i:i + 100]
+        try:
+            dynamodb.transact_write_items(
+                TransactItems=[{'Update': combined_flag_update(job_id, timestamp)} for job_id in batch]
+            )
+            print(f"Successfully updated combined flag for {len(batch)} jobs")
+        except Exception as e:
+            # The transaction is all-or-nothing; retry individually so one bad job doesn't block the rest
+            print(f"Batched combined flag update failed, updating individually: {str(e)}")
+            for job_id in batch:
+                update_combined_flag(job_id)
 
-            # Check if webhook_url exists and is not empty
-            webhook_url = new_image.get('webhook_url', {}).get('S', '')
+def lambda_handler(event, context):
+    print(f"Processing {len(event['Records'])} stream records")
+    # Jobs to mark as combined, written together once the records are handled
+    combined_job_ids = []
 
-            # If no webhook URL, just mark as combined and skip processing
-            if not webhook_url:
-                print(f"Job {job_id} has no webhook_url, marking as combined")
-                if table_name:
-                    update_combined_flag(job_id)
+    try:
+        for record in event['Records']:
+            # Only process MODIFY events
+            if record['eventName'] != 'MODIFY':
+                print(f"Skipping {record['eventName']} event")
                 continue
 
-            # Validate webhook URL
-            if not is_valid_url(webhook_url):
-                print(f"Job {job_id} has invalid webhook_url: {webhook_url}, marking as combined")
-                if table_name:
-                    update_combined_flag(job_id)
+            old_image = record['dynamodb'].get('OldImage', {})
+            new_image = record['dynamodb'].get('NewImage', {})
+
+            # Check for required job_id field
+            if 'job_id' not in new_image or 'S' not in new_image['job_id']:
+                print("Error: Missing job_id in DynamoDB record, skipping")
                 continue
 
-            # Get S3 URLs from DynamoDB record
-            rules_result_url = new_image.get('transcript_rules_result_s3_url', {}).get('S', '')
-            llm_safety_result_url = new_image.get('transcript_llm_safety_result_s3_url', {}).get('S', '')
-            llm_summary_result_url = new_image.get('transcript_llm_summary_result_s3_url', {}).get('S', '')
-            image_llm_safety_result_url = new_image.get('video_llm_result_s3_url', {}).get('S', '')
-
-            # Fetch files from S3
-            print(f"Fetching safety analysis files for job {job_id}")
-            rules_data = fetch_s3_file(rules_result_url) if rules_result_url else None
-            llm_safety_data = fetch_s3_file(llm_safety_result_url) if llm_safety_result_url else None
-            llm_summary_data = fetch_s3_file(llm_summary_result_url) if llm_summary_result_url else None
-            image_llm_safety_data = fetch_s3_file(image_llm_safety_result_url) if image_llm_safety_result_url else None
-
-            # Calculate highest severity levels
-            # Transcript severity: highest from rules_result and llm_safety_result
-            transcript_files = [rules_data, llm_safety_data]
-            transcript_highest_severity = get_highest_severity(transcript_files)
-
-            # Video severity: from image_llm_safety_result
-            video_files = [image_llm_safety_data]
-            video_highest_severity = get_highest_severity(video_files)
-
-            # Build webhook payload
-            webhook_payload = {
-                'job_id': job_id,
-                'transcript_highest_severity_level': transcript_highest_severity,
-                'video_highest_severity_level': video_highest_severity,
-                'rules_result_url': rules_result_url,
-                'llm_safety_result_url': llm_safety_result_url,
-                'llm_summary_result_url': llm_summary_result_url,
-                'image_llm_safety_result_url': image_llm_safety_result_url
-            }
-
-            # Call webhook with retry logic
-            webhook_success = call_webhook_with_retry(webhook_url, webhook_payload)
-
-            # Update combined flag only if webhook succeeded
-            if webhook_success:
-                print(f"Webhook successful for job {job_id}, marking as combined")
-                if table_name:
-                    update_combined_flag(job_id)
-            else:
-                print(f"Webhook failed for job {job_id} after retries, NOT marking as combined")
+            job_id = new_image['job_id']['S']
+
+            old_transcript = old_image.get('transcript_complete', {}).get('BOOL', False)
+            old_video = old_image.get('video_complete', {}).get('BOOL', False)
+
+            new_transcript = new_image.get('transcript_complete', {}).get('BOOL', False)
+            new_video = new_image.get('video_complete', {}).get('BOOL', False)
+            combined = new_image.get('combined', {}).get('BOOL', False)
+
+            # Check if this update just completed both branches
+            was_incomplete = not (old_transcript and old_video)
+            is_complete = new_transcript and new_video
+
+            # print all of the variables in this row
+            print(f"Processing job {job_id}, combined {combined}, webhook {new_image.get('webhook_url', {}).get('S', '')}, table_name {table_name}")
+
+
+            if was_incomplete and is_complete and not combined:
+                print(f"Job {job_id} ready for combination, processing...")
+
+                # Check if webhook_url exists and is not empty
+                webhook_url = new_image.get('webhook_url', {}).get('S', '')
+
+                # If no webhook URL, just mark as combined and skip processing
+                if not webhook_url:
+                    print(f"Job {job_id} has no webhook_url, marking as combined")
+                    combined_job_ids.append(job_id)
+                    continue
+
+                # Validate webhook URL
+                if not is_valid_url(webhook_url):
+                    print(f"Job {job_id} has invalid webhook_url: {webhook_url}, marking as combined")
+                    combined_job_ids.append(job_id)
+                    continue
+
+                # A retried batch redelivers the same records; skip jobs already notified last time
+                if is_already_combined(job_id):
+                    print(f"Job {job_id} was already combined, skipping webhook")
+                    continue
+
+                # Get S3 URLs from DynamoDB record
+                rules_result_url = new_image.get('transcript_rules_result_s3_url', {}).get('S', '')
+                llm_safety_result_url = new_image.get('transcript_llm_safety_result_s3_url', {}).get('S', '')
+                llm_summary_result_url = new_image.get('transcript_llm_summary_result_s3_url', {}).get('S', '')
+                image_llm_safety_result_url = new_image.get('video_llm_result_s3_url', {}).get('S', '')
+
+                # Fetch files from S3, overlapping the round-trips
+                print(f"Fetching safety analysis files for job {job_id}")
+                rules_data, llm_safety_data, llm_summary_data, image_llm_safety_data = executor.map(
+                    lambda url: fetch_s3_file(url) if url else None,
+                    [rules_result_url, llm_safety_result_url, llm_summary_result_url, image_llm_safety_result_url]
+                )
+
+                # Calculate highest severity levels
+                # Transcript severity: highest from rules_result and llm_safety_result
+                transcript_files = [rules_data, llm_safety_data]
+                transcript_highest_severity = get_highest_severity(transcript_files)
+
+                # Video severity: from image_llm_safety_result
+                video_files = [image_llm_safety_data]
+                video_highest_severity = get_highest_severity(video_files)
+
+                # Build webhook payload
+                webhook_payload = {
+                    'job_id': job_id,
+                    'transcript_highest_severity_level': transcript_highest_severity,
+                    'video_highest_severity_level': video_highest_severity,
+                    'rules_result_url': rules_result_url,
+                    'llm_safety_result_url': llm_safety_result_url,
+                    'llm_summary_result_url': llm_summary_result_url,
+                    'image_llm_safety_result_url': image_llm_safety_result_url
+                }
+
+                # Call webhook with retry logic
+                webhook_success = call_webhook_with_retry(webhook_url, webhook_payload)
+
+                # Update combined flag only if webhook succeeded
+                if webhook_success:
+                    print(f"Webhook successful for job {job_id}, marking as combined")
+                    combined_job_ids.append(job_id)
+                else:
+                    print(f"Webhook failed for job {job_id} after retries, NOT marking as combined")
+    finally:
+        # Runs even if a later record fails, so jobs whose webhooks already fired are marked
+        # and is_already_combined skips them when the batch is retried
+        if combined_job_ids and table_name:
+            update_combined_flags(combined_job_ids)
 
     return {'statusCode': 200}
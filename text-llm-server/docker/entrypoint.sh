@@ -129,8 +129,12 @@ log "Starting VLLM server..."
 log "Command: python3 -m vllm.entrypoints.openai.api_server --model ${MODEL_PATH} ..."
 
 # Build command properly using array to handle spaces/special chars
+# Every request starts with the same system prompt and instructions, so keep their KV cache
+# between requests instead of recomputing the prefill each time
 exec python3 -m vllm.entrypoints.openai.api_server \
     --model "${MODEL_PATH}" \
+    --enable-prefix-caching \
+    --enable-prompt-tokens-details \
     --host "${HOST}" \
     --port "${PORT}" \
     --gpu-memory-utilization "${GPU_MEMORY_UTILIZATION}" \
@@ -1,15 +1,21 @@
 """Utilities for SQS polling server."""
 
-import json
+import gzip
+import hashlib
 import logging
 import os
 import signal
 import sys
+import threading
 import time
-from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import UTC, datetime
 from typing import Any
 
 import boto3
+import orjson
+from botocore.config import Config
 
 from core.model_client import ModelClient
 from core.utils.model_utils import get_json_schema, get_system_prompt, get_user_prompt
@@ -24,24 +30,66 @@ QUEUE_NAME = os.getenv("SQS_QUEUE_NAME", "ai-chaperone-text-llm-queue")
 REGION = os.getenv("AWS_REGION", "us-east-2")
 OUTPUT_BUCKET = os.getenv("OUTPUT_BUCKET", "ai-chaperone-dev")
 DYNAMO_TABLE = os.getenv("DYNAMO_TABLE", "ai-chaperone-video-moderation-jobs")
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "10"))
+VISIBILITY_TIMEOUT = int(os.getenv("VISIBILITY_TIMEOUT", "60"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+# Opt-in: gzipped results need readers that decode Content-Encoding themselves (boto3 and the CLI don't)
+GZIP_RESULTS = os.getenv("GZIP_RESULTS", "false").lower() in ("1", "true", "yes")
+# Results smaller than this gain little from gzip and are stored as plain JSON
+GZIP_MIN_BYTES = 1024
+# SQS caps receive_message and delete_message_batch at 10 messages
+SQS_BATCH_SIZE = 10
 
 
 class SQSPollingServer:
     """Server that polls AWS SQS."""
 
-    def __init__(self, queue_name: str, region: str = "us-east-2") -> None:
+    def __init__(self, queue_name: str, region: str = "us-east-2", max_workers: int = MAX_WORKERS) -> None:
         """Initialize the SQS polling server."""
         self.queue_name = queue_name
         self.region = region
         self.running = True
 
-        # Initialize AWS clients
-        self.sqs = boto3.client("sqs", region_name=region)
-        self.s3 = boto3.client("s3", region_name=region)
-        self.dynamo_table = boto3.resource("dynamodb", region_name=region).Table(
-            DYNAMO_TABLE,
+        # Worker pool for concurrent message processing
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="text-worker")
+        self._in_flight = 0
+        self._capacity = threading.Condition()
+        self._pending_deletes: list[str] = []
+        self._delete_lock = threading.Lock()
+
+        # Receipt handles of in-flight messages, kept hidden by the heartbeat thread
+        self._active_receipts: set[str] = set()
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="visibility-heartbeat", daemon=True)
+
+        # Parsed LLM results of recent transcripts, so retries and duplicate transcripts skip the LLM
+        self._result_cache: OrderedDict[tuple[str, bytes], dict[str, Any]] = OrderedDict()
+        self._result_cache_lock = threading.Lock()
+        # Separate pool for each job's summary call, so workers never wait on their own pool
+        self.analysis_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="text-analysis")
+
+        # Initialize AWS clients from one session so credentials are resolved once and shared
+        self.session = boto3.session.Session(region_name=region)
+        # Pooled keep-alive connections for every worker plus the poller, so sockets are reused instead of
+        # re-handshaking TLS per call; the read timeout stays above the 20s long poll
+        aws_config = Config(
+            max_pool_connections=max(50, max_workers + 2),
+            tcp_keepalive=True,
+            connect_timeout=5,
+            read_timeout=65,
+            retries={"mode": "adaptive", "total_max_attempts": 5},
         )
-        self.model_client = ModelClient()
+        self.sqs = self.session.client("sqs", config=aws_config)
+        self.s3 = self.session.client("s3", config=aws_config)
+        # Low-level client: the few fixed attributes are serialized by hand instead of via the resource layer
+        self.dynamodb = self.session.client("dynamodb", config=aws_config)
+        # Each worker can have its safety and summary requests in flight at once
+        self.model_client = ModelClient(pool_size=2 * max_workers)
+
+        # The system prompt and schemas never change, so build them once instead of per message
+        self.system_prompt = get_system_prompt()
+        self.json_schemas = {request_type: get_json_schema(request_type) for request_type in ("safety", "summary")}
 
         # Get queue URL
         try:
@@ -56,10 +104,9 @@ class SQSPollingServer:
         """Parse S3 URL to get bucket and key."""
         # s3://bucket-name/path/to/object
         if s3_url.startswith("s3://"):
-            s3_url = s3_url[5:]
-            parts = s3_url.split("/", 1)
-            if len(parts) == 2:
-                return parts[0], parts[1]
+            bucket, separator, key = s3_url[5:].partition("/")
+            if separator:
+                return bucket, key
         return None, None
 
     def _parse_llm_response(self, response: dict) -> dict[str, Any] | None:  # noqa: PLR0911
@@ -68,7 +115,6 @@ class SQSPollingServer:
         Check for validity and get JSON
         """
         if not isinstance(response, dict):
-            logger.error("Invalid LLM response: expected dict, got %s", type(response).__name__)
             logger.error("Invalid LLM response: expected dict, got %s", type(response).__name__)
             return None
 
@@ -92,14 +138,14 @@ class SQSPollingServer:
             logger.error("Invalid LLM response: 'content' missing or empty")
             return None
 
-        logger.info("Raw LLM content: %s", content)
-        logger.info("Stripped LLM content: %s", content[8:-3].strip())
+        logger.debug("Raw LLM content: %s", content)
+        # if content begins and ends with triple backticks, remove them
+        if content.startswith("```json") and content.endswith("```"):
+            content = content.removeprefix("```json").removesuffix("```").strip()
+            logger.debug("Stripped LLM content: %s", content)
         try:
-            # if content begins and ends with triple backticks, remove them
-            if content.startswith("```json") and content.endswith("```"):
-                content = content[8:-3].strip()
-            parsed_content = json.loads(content)
-        except json.JSONDecodeError:
+            parsed_content = orjson.loads(content)
+        except orjson.JSONDecodeError:
             logger.exception("Failed to parse LLM response content as JSON")
             return None
         else:
@@ -123,63 +169,73 @@ class SQSPollingServer:
 
         self._log_transcript_preview(transcript)
 
-        messages = self._build_messages(transcript)
-        if messages is None:
-            return False
-
-        json_schema = self._get_json_schema()
-        if json_schema is None:
-            return False
-
-        response = self._call_llm(messages, json_schema=json_schema)
-        if response is None:
-            return False
-
-        llm_result = self._parse_llm_response(response)
-        if llm_result is None:
-            logger.error("Failed to parse LLM response")
+        # The summary doesn't depend on the safety result, so both LLM calls run at the same time
+        summary_future = self.analysis_executor.submit(self._run_analysis, job_id, transcript, "summary")
+        safety_s3_url = self._run_analysis(job_id, transcript, "safety")
+        summary_s3_url = summary_future.result()
+        if safety_s3_url is None or summary_s3_url is None:
             return False
 
-        logger.info("LLM Result: %s", json.dumps(llm_result, indent=2))
         logger.info("Successfully processed job: %s", job_id)
 
-        s3_url = self._save_result_to_s3(job_id, llm_result)
-        if s3_url is None:
-            return False
+        # One write records both results and completes the transcript, so it is never half-updated
+        return self._update_dynamo(job_id, safety_s3_url, summary_s3_url)
 
-        if not self._update_dynamo(job_id, s3_url):
-            return False
+    def _run_analysis(self, job_id: str, transcript: str, request_type: str = "safety") -> str | None:
+        """Run one LLM analysis of the transcript and return the S3 URL of its result."""
+        cache_key = (request_type, hashlib.sha256(transcript.encode("utf-8")).digest())
+        llm_result = self._get_cached_result(cache_key)
+        if llm_result is not None:
+            logger.info("Reusing cached LLM %s result for job: %s", request_type, job_id)
+            return self._save_result_to_s3(job_id, llm_result, output_type=request_type)
 
-        summary_messages = self._build_messages(transcript, request_type="summary")
-        if summary_messages is None:
-            return False
-
-        summary_json_schema = self._get_json_schema(request_type="summary")
-        if summary_json_schema is None:
-            return False
-
-        summary_response = self._call_llm(summary_messages, json_schema=summary_json_schema)
-        if summary_response is None:
-            return False
+        messages = self._build_messages(transcript, request_type=request_type)
+        if messages is None:
+            return None
 
-        llm_summary = self._parse_llm_response(summary_response)
-        if llm_summary is None:
-            logger.error("Failed to parse LLM summary response")
-            return False
+        json_schema = self._get_json_schema(request_type=request_type)
+        if json_schema is None:
+            return None
 
-        logger.info("LLM Summary: %s", json.dumps(llm_summary, indent=2))
+        response = self._call_llm(messages, json_schema=json_schema)
+        if response is None:
+            return None
 
-        s3_url = self._save_result_to_s3(job_id, llm_summary, output_type="summary")
-        if not s3_url:
-            return False
+        llm_result = self._parse_llm_response(response)
+        if llm_result is None:
+            logger.error("Failed to parse LLM %s response", request_type)
+            return None
 
-        return self._update_dynamo(job_id, s3_url, output_type="summary")
+        if logger.isEnabledFor(logging.DEBUG):
+            pretty_result = orjson.dumps(llm_result, option=orjson.OPT_INDENT_2).decode()
+            logger.debug("LLM %s result: %s", request_type, pretty_result)
+        self._cache_result(cache_key, llm_result)
+
+        return self._save_result_to_s3(job_id, llm_result, output_type=request_type)
+
+    def _get_cached_result(self, cache_key: tuple[str, bytes]) -> dict[str, Any] | None:
+        """Return the cached LLM result for this transcript and request type, if any."""
+        with self._result_cache_lock:
+            llm_result = self._result_cache.get(cache_key)
+            if llm_result is not None:
+                self._result_cache.move_to_end(cache_key)
+            return llm_result
+
+    def _cache_result(self, cache_key: tuple[str, bytes], llm_result: dict[str, Any]) -> None:
+        """Cache an LLM result, evicting the least recently used one when full."""
+        if RESULT_CACHE_SIZE <= 0:
+            return
+        with self._result_cache_lock:
+            self._result_cache[cache_key] = llm_result
+            self._result_cache.move_to_end(cache_key)
+            if len(self._result_cache) > RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
 
     def _parse_message(self, message_body: str) -> dict[str, Any] | None:
         """Parse and validate incoming message JSON."""
         try:
-            data = json.loads(message_body)
-        except json.JSONDecodeError:
+            data = orjson.loads(message_body)
+        except orjson.JSONDecodeError:
             logger.exception("Failed to parse message JSON")
             return None
 
@@ -208,42 +264,59 @@ class SQSPollingServer:
 
     def _log_transcript_preview(self, transcript: str) -> None:
         """Log a short preview of the transcript for debugging."""
-        logger.info("Transcript preview: %s ...", transcript[:200])
+        logger.debug("Transcript preview: %s ...", transcript[:200])
 
     def _build_messages(self, transcript_content: str, request_type: str = "safety") -> list[Any] | None:
         """Build messages for the LLM call."""
         try:
+            # Static system prompt and instructions first, transcript last, so the model server can
+            # reuse the cached prefix across jobs
             user_prompt = get_user_prompt(transcript_content, output_type=request_type)
-            return [
-                {"role": "system", "content": get_system_prompt()},
-                {"role": "user", "content": user_prompt},
-            ]
         except Exception:
             logger.exception("Failed to build prompts")
             return None
+        else:
+            return [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": user_prompt},
+            ]
 
     def _get_json_schema(self, request_type: str = "safety") -> dict[str, Any] | None:
-        return get_json_schema(request_type)
+        return self.json_schemas.get(request_type)
 
     def _call_llm(self, messages: list[dict[Any, Any]], json_schema: dict[str, Any] | None = None) -> list[Any] | None:
         """Call the LLM and return raw response."""
         try:
-            return self.model_client.chat_completion(messages, temperature=0.3, extra_body={"guided_json": json_schema})
+            response = self.model_client.chat_completion(
+                messages, temperature=0.3, extra_body={"guided_json": json_schema},
+            )
         except Exception:
             logger.exception("LLM call failed")
             return None
+        else:
+            usage = response.get("usage") if isinstance(response, dict) else None
+            if usage:
+                cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+                logger.info("LLM prompt tokens: %s (cached: %s)", usage.get("prompt_tokens"), cached_tokens)
+            return response
 
     def _save_result_to_s3(
         self, job_id: str, llm_result: dict[str, Any] | str, output_type: str = "safety"
     ) -> str | None:
         """Persist LLM result JSON to S3 and return the s3:// URL."""
         result_key = f"moderation-results/{job_id}/llm_{output_type}_result.json"
+        body = orjson.dumps(llm_result)
+        extra_args = {}
+        if GZIP_RESULTS and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body, compresslevel=3)
+            extra_args["ContentEncoding"] = "gzip"
         try:
             self.s3.put_object(
                 Bucket=OUTPUT_BUCKET,
                 Key=result_key,
-                Body=json.dumps(llm_result).encode("utf-8"),
+                Body=body,
                 ContentType="application/json",
+                **extra_args,
             )
             url = f"s3://{OUTPUT_BUCKET}/{result_key}"
             logger.info("LLM result saved to %s ", url)
@@ -255,20 +328,22 @@ class SQSPollingServer:
         else:
             return url
 
-    def _update_dynamo(self, job_id: str, result_s3_url: str, output_type: str = "safety") -> bool:
-        """Update DynamoDB with job status and result location."""
-        url_var = (
-            "transcript_llm_safety_result_s3_url" if output_type == "safety" else "transcript_llm_summary_result_s3_url"
-        )
-        is_complete = output_type == "summary"
+    def _update_dynamo(self, job_id: str, safety_s3_url: str, summary_s3_url: str) -> bool:
+        """Update DynamoDB with both result locations and mark the transcript complete."""
         try:
-            self.dynamo_table.update_item(
-                Key={"job_id": job_id},
-                UpdateExpression=f"SET {url_var} = :url, transcript_complete = :complete, updated_at = :time",
+            self.dynamodb.update_item(
+                TableName=DYNAMO_TABLE,
+                Key={"job_id": {"S": job_id}},
+                UpdateExpression=(
+                    "SET transcript_llm_safety_result_s3_url = :safety, "
+                    "transcript_llm_summary_result_s3_url = :summary, "
+                    "transcript_complete = :complete, updated_at = :time"
+                ),
                 ExpressionAttributeValues={
-                    ":url": result_s3_url,
-                    ":complete": is_complete,
-                    ":time": datetime.utcnow().isoformat(),
+                    ":safety": {"S": safety_s3_url},
+                    ":summary": {"S": summary_s3_url},
+                    ":complete": {"BOOL": True},
+                    ":time": {"S": datetime.now(UTC).isoformat()},
                 },
             )
             logger.info("DynamoDB updated for job_id: %s ", job_id)
@@ -279,41 +354,138 @@ class SQSPollingServer:
         else:
             return True
 
+    def _queue_delete(self, receipt_handle: str) -> None:
+        """Queue a receipt handle for deletion, flushing once a full batch is pending."""
+        with self._delete_lock:
+            self._pending_deletes.append(receipt_handle)
+            if len(self._pending_deletes) < SQS_BATCH_SIZE:
+                return
+            batch = self._pending_deletes[:SQS_BATCH_SIZE]
+            del self._pending_deletes[:SQS_BATCH_SIZE]
+        self._delete_batch(batch)
+
+    def _flush_deletes(self) -> None:
+        """Delete all pending messages from the queue."""
+        with self._delete_lock:
+            pending = self._pending_deletes
+            self._pending_deletes = []
+        for i in range(0, len(pending), SQS_BATCH_SIZE):
+            self._delete_batch(pending[i:i + SQS_BATCH_SIZE])
+
+    def _delete_batch(self, receipt_handles: list[str]) -> None:
+        """Delete up to 10 messages from the queue in a single call."""
+        try:
+            response = self.sqs.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(i), "ReceiptHandle": handle} for i, handle in enumerate(receipt_handles)],
+            )
+        except Exception:
+            # Messages will become visible again after VisibilityTimeout
+            logger.exception("Failed to delete %s message(s) from queue", len(receipt_handles))
+            return
+
+        for failure in response.get("Failed", []):
+            logger.error("Failed to delete message %s: %s", failure.get("Id"), failure.get("Message"))
+        logger.info("Deleted %s message(s) from queue", len(response.get("Successful", [])))
+
+    def _extend_visibility(self, receipt_handles: list[str]) -> None:
+        """Reset the visibility timeout of up to 10 in-flight messages in a single call."""
+        try:
+            response = self.sqs.change_message_visibility_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": handle, "VisibilityTimeout": VISIBILITY_TIMEOUT}
+                    for i, handle in enumerate(receipt_handles)
+                ],
+            )
+        except Exception:
+            logger.exception("Failed to extend visibility of %s message(s)", len(receipt_handles))
+            return
+
+        for failure in response.get("Failed", []):
+            logger.error("Failed to extend visibility of message %s: %s", failure.get("Id"), failure.get("Message"))
+
+    def _heartbeat_loop(self) -> None:
+        """Keep in-flight messages hidden until their jobs finish, however long they take."""
+        interval = max(VISIBILITY_TIMEOUT // 2, 1)
+        while not self._heartbeat_stop.wait(interval):
+            with self._capacity:
+                receipt_handles = list(self._active_receipts)
+            for i in range(0, len(receipt_handles), SQS_BATCH_SIZE):
+                self._extend_visibility(receipt_handles[i:i + SQS_BATCH_SIZE])
+
+    def _on_message_done(self, future: Future, receipt_handle: str) -> None:
+        """Release the worker slot and queue the message for deletion if it succeeded."""
+        with self._capacity:
+            self._in_flight -= 1
+            self._active_receipts.discard(receipt_handle)
+            self._capacity.notify()
+
+        if future.cancelled():
+            return
+
+        try:
+            success = future.result()
+        except Exception:
+            logger.exception("Unhandled error processing message")
+            success = False
+
+        if success:
+            self._queue_delete(receipt_handle)
+        else:
+            # Message will become visible again after VisibilityTimeout
+            logger.warning("Message processing failed, will retry later")
+
+    def _wait_for_capacity(self) -> int:
+        """Block until a worker is free and return the number of free workers."""
+        with self._capacity:
+            while self.running and self._in_flight >= self.max_workers:
+                self._capacity.wait(timeout=1)
+            return self.max_workers - self._in_flight
+
     def poll_queue(self) -> None:
         """Poll the SQS queue for messages."""
         while self.running:
             try:
+                # Receive again as soon as any worker frees up, instead of after the whole batch
+                free_workers = self._wait_for_capacity()
+                if not self.running:
+                    break
+
                 # Long polling with 20 second wait time
                 response = self.sqs.receive_message(
                     QueueUrl=self.queue_url,
-                    MaxNumberOfMessages=1,  # Process up to 1 message at once
+                    MaxNumberOfMessages=min(free_workers, SQS_BATCH_SIZE),
                     WaitTimeSeconds=20,  # Long polling
-                    VisibilityTimeout=60,  # 1 minute to process
+                    VisibilityTimeout=VISIBILITY_TIMEOUT,  # Extended by the heartbeat while processing
                 )
 
                 messages = response.get("Messages", [])
 
                 if messages:
-                    logger.info("Received %s  message(s)", len(messages))
+                    logger.info("Received %s message(s)", len(messages))
 
                     for message in messages:
-                        # Process the message
-                        success = self.process_message(message["Body"])
-
-                        if success:
-                            # Delete message from queue after successful processing
-                            self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message["ReceiptHandle"])
-                            logger.info("Message deleted from queue")
-                        else:
-                            # Message will become visible again after VisibilityTimeout
-                            logger.warning("Message processing failed, will retry later")
+                        if not self.running:
+                            # Unsubmitted messages become visible again after VisibilityTimeout
+                            break
+                        with self._capacity:
+                            self._in_flight += 1
+                            self._active_receipts.add(message["ReceiptHandle"])
+                        future = self.executor.submit(self.process_message, message["Body"])
+                        future.add_done_callback(
+                            lambda f, handle=message["ReceiptHandle"]: self._on_message_done(f, handle),
+                        )
                 else:
                     logger.debug("No messages in queue")
 
+                # Deletes for partially filled batches go out once per poll cycle
+                self._flush_deletes()
+
             except KeyboardInterrupt:
                 logger.info("Received interrupt signal")
                 self.shutdown()
-            except Exception as e:
+            except Exception:
                 logger.exception("Error polling queue")
                 time.sleep(5)  # Wait before retrying
 
@@ -321,6 +493,8 @@ class SQSPollingServer:
         """Gracefully shutdown the server."""
         logger.info("Shutting down server...")
         self.running = False
+        # Jobs that have not started are dropped and will be redelivered by SQS
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
     def run(self) -> None:
         """Start the polling server."""
@@ -332,8 +506,16 @@ class SQSPollingServer:
         signal.signal(signal.SIGTERM, lambda s, f: self.shutdown())
 
         # Start polling
+        self._heartbeat.start()
         self.poll_queue()
 
+        # Let in-flight jobs finish and clean up their messages
+        self.executor.shutdown(wait=True)
+        self.analysis_executor.shutdown(wait=True)
+        self._heartbeat_stop.set()
+        self._heartbeat.join()
+        self._flush_deletes()
+
         logger.info("Server stopped")
 
 
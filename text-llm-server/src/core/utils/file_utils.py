@@ -1,8 +1,12 @@
 """Utilities for loading files."""
-import json
+from contextlib import suppress
 from functools import lru_cache
 from pathlib import Path
 
+import orjson
+
+# Package root that config and prompt paths are relative to
+_BASE_DIR = Path(__file__).parent.parent
 
 @lru_cache(maxsize=1)
 def _load_config(config_path : str | Path ="prompts/config.json") -> dict:
@@ -16,13 +20,23 @@ def _load_config(config_path : str | Path ="prompts/config.json") -> dict:
         dict: dictionary of config data
 
     """
-    config_path = Path(__file__).parent.parent / Path(config_path)
-    if not config_path.exists():
+    config_path = _BASE_DIR / config_path
+    try:
+        return orjson.loads(config_path.read_bytes())
+    except FileNotFoundError:
         msg = f"Could not find prompts config file {config_path}"
-        raise FileNotFoundError(msg)
+        raise FileNotFoundError(msg) from None
+
+DEFAULT_CONFIG_PATH = "prompts/config.json"
+DEFAULT_PROMPTS_DIR = "prompts"
+
+# The bundled config is read once at import, so validating the default config is two set lookups
+_DEFAULT_CONFIG = _load_config(DEFAULT_CONFIG_PATH)
+_DEFAULT_PROMPT_TYPES = frozenset(_DEFAULT_CONFIG["prompt_types"])
+_DEFAULT_CATEGORY_TYPES = frozenset(_DEFAULT_CONFIG["category_types"])
 
-    with config_path.open(encoding="utf-8") as f:
-        return json.load(f)
+# Contents of the bundled prompt files, keyed by (prompt_type, category_type)
+_PROMPT_CACHE: dict[tuple[str, str], str] = {}
 
 def validate_types(prompt_type: str, category_type: str, config_path: str="prompts/config.json") -> None:
     """Validate if prompt type and category type exist.
@@ -40,9 +54,13 @@ def validate_types(prompt_type: str, category_type: str, config_path: str="promp
         output_msg = "prompt_type or category_type cannot be empty"
         raise ValueError(output_msg)
 
-    config_data = _load_config(config_path)
-    valid_prompt_types = config_data["prompt_types"]
-    valid_category_types = config_data["category_types"]
+    if config_path == DEFAULT_CONFIG_PATH:
+        valid_prompt_types = _DEFAULT_PROMPT_TYPES
+        valid_category_types = _DEFAULT_CATEGORY_TYPES
+    else:
+        config_data = _load_config(config_path)
+        valid_prompt_types = config_data["prompt_types"]
+        valid_category_types = config_data["category_types"]
 
     if prompt_type not in valid_prompt_types:
         error_msg = f"Invalid prompt type '{prompt_type}'"
@@ -53,7 +71,6 @@ def validate_types(prompt_type: str, category_type: str, config_path: str="promp
         f"Valid options: {valid_category_types}"
         raise ValueError(error_msg)
 
-@lru_cache(maxsize=32)
 def load_file(
     prompt_type: str,
     category_type: str,
@@ -61,7 +78,8 @@ def load_file(
     prompts_dir:str="prompts") -> str:
     """Load and cache prompt file contents.
 
-    Across subsequent calls, the same path returns the same cached result.
+    Bundled prompts are cached in a plain dict keyed by prompt and category type, so repeat
+    calls with the default paths skip lru_cache's argument hashing. Custom paths are read each call.
 
     Args:
         prompt_type (str): type of prompt you want to validate.
@@ -70,11 +88,27 @@ def load_file(
         prompts_dir (str): path to main prompts dir. default="prompts"
 
     """
+    use_cache = config_path == DEFAULT_CONFIG_PATH and prompts_dir == DEFAULT_PROMPTS_DIR
+    if use_cache:
+        cached = _PROMPT_CACHE.get((prompt_type, category_type))
+        if cached is not None:
+            return cached
+
     validate_types(prompt_type=prompt_type, category_type=category_type, config_path=config_path)
-    file_path = Path(__file__).parent.parent / Path(prompts_dir) / prompt_type / f"{category_type}.md"
+    file_path = _BASE_DIR / prompts_dir / prompt_type / f"{category_type}.md"
 
-    if not file_path.exists():
+    try:
+        content = file_path.read_bytes().decode("utf-8").strip()
+    except FileNotFoundError:
         error_msg = f"Missing {category_type}.md for {prompt_type}"
-        raise FileNotFoundError(error_msg)
-
-    return file_path.read_text(encoding="utf-8").strip()
+        raise FileNotFoundError(error_msg) from None
+    if use_cache:
+        _PROMPT_CACHE[(prompt_type, category_type)] = content
+    return content
+
+# Read every bundled prompt up front so serving a request never touches the filesystem;
+# some combinations (e.g. "json" prompts) have no file
+for _prompt_type in _DEFAULT_PROMPT_TYPES:
+    for _category_type in _DEFAULT_CATEGORY_TYPES:
+        with suppress(FileNotFoundError):
+            load_file(_prompt_type, _category_type)